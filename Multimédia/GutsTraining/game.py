@@ -3,11 +3,46 @@
 import pygame
 from typing import List
 import math
+import numpy as np
 import random
 import os
 import lib
 import snowflakes  
 
+# Calques en 8 bits indexés dans lib.FULL_PALETTE (False : surfaces RGB)
+INDEXED_LAYERS = True
+
+
+def new_layer(size, transparent=False):
+    if INDEXED_LAYERS:
+        return lib.indexed_surface(size, transparent=transparent)
+    if transparent:
+        return pygame.Surface(size, pygame.SRCALPHA)
+    return pygame.Surface(size)
+
+
+# À incrémenter quand un générateur de calque change : les calques en cache
+# (lib.cached_layer) sont alors régénérés
+LAYER_VERSION = 1
+
+# Animation de l'arbre
+TREE_FRAMES = 60
+TREE_FRAME_SIZE = (300, 350)
+TREE_SHEET_COLS = 10
+TREE_MAX_DEPTH = 7
+TREE_WIND = 2.5
+
+
+def cached_layer(scene, name, create, palettes, params=()):
+    """create(scene) via le cache disque de lib, avec la version des générateurs."""
+    return lib.cached_layer(
+        name,
+        lambda: create(scene),
+        params=(LAYER_VERSION, INDEXED_LAYERS) + tuple(params),
+        palettes=tuple(palettes) + (lib.FULL_PALETTE,),
+        size=scene.window_size,
+    )
+
 
 def show_palette_test(screen):
     """
@@ -93,8 +128,10 @@ def render_scene(scene: lib.Scene) -> bool:
         wind_time = scene.time_game * 0.8
         frame_index = int((wind_time * 12) % len(scene.tree_animation))  # 12 frames/sec
         
-        current_tree = scene.tree_animation[frame_index]
-        screen.blit(current_tree, (10, 70))  
+        # Image la plus proche tant que l'animation se calcule en arrière-plan
+        current_tree = scene.tree_animation.nearest(frame_index)
+        if current_tree is not None:
+            screen.blit(current_tree, (10, 70))  
     
     
     # ZONE 7 : NEIGE AU SOL  Texture détaillée
@@ -120,22 +157,19 @@ def create_static_background(scene: lib.Scene):
     
     print("Génération du background statique (ciel + colline)...")
     
-    bg = pygame.Surface((width, 280))  
+    bg = new_layer((width, 280))  
     
     # ZONE 1 : CIEL HIVERNAL (280px de haut)
     sky_top = lib.SKY_COLORS[5]      
     sky_bottom = lib.SKY_COLORS[0]   
     
     
-    for y in range(280):
-        for x in range(width):
-            pixel_color = lib.dither_gradient(
-                x, y,
-                sky_top, sky_bottom,
-                0, 280,
-                lib.SKY_COLORS
-            )
-            bg.set_at((x, y), pixel_color)
+    lib.dither_gradient_fill(
+        bg, (0, 0, width, 280),
+        sky_top, sky_bottom,
+        0, 280,
+        lib.SKY_COLORS
+    )
     
     # ZONE 2 : MONTAGNES EN PLUSIEURS COUCHES , effet de profondeur
     
@@ -158,57 +192,92 @@ def create_static_background(scene: lib.Scene):
     mountain_base_y = 280  
     
     # Dessine chaque montagne de l'arrière vers l'avant
+    xs = np.arange(width)
+    ys = np.arange(280)[:, None]
     for center_x, mtn_width, mtn_height, color_depth in mountains:
-        for x in range(width):
-            dx = (x - center_x) / (mtn_width / 2)
-            
-            if abs(dx) <= 1.0:  
-
-                peak_y = mountain_base_y - mtn_height * (1 - abs(dx))
-                
-
-                for y in range(int(peak_y), mountain_base_y):
-                    if 0 <= y < 280:  
-                        if color_depth == 0:
-                            top_color = lib.HILL_COLORS[0]
-                            bottom_color = lib.HILL_COLORS[1]
-                        elif color_depth == 1:
-                            top_color = lib.HILL_COLORS[1]
-                            bottom_color = lib.HILL_COLORS[2]
-                        else:
-                            top_color = lib.HILL_COLORS[2]
-                            bottom_color = (100, 110, 125)  
-                        
-                        pixel_color = lib.dither_gradient(
-                            x, y,
-                            top_color,
-                            bottom_color,
-                            int(peak_y), mountain_base_y,
-                            lib.HILL_COLORS
-                        )
-                        bg.set_at((x, y), pixel_color)
+        dx = (xs - center_x) / (mtn_width / 2)
+        inside = np.abs(dx) <= 1.0
+        
+        # Sommet de chaque colonne : le dégradé va de là jusqu'à la base
+        peak_y = (mountain_base_y - mtn_height * (1 - np.abs(dx))).astype(np.int64)
+        silhouette = inside & (ys >= peak_y) & (ys < mountain_base_y)
+        
+        if color_depth == 0:
+            top_color = lib.HILL_COLORS[0]
+            bottom_color = lib.HILL_COLORS[1]
+        elif color_depth == 1:
+            top_color = lib.HILL_COLORS[1]
+            bottom_color = lib.HILL_COLORS[2]
+        else:
+            top_color = lib.HILL_COLORS[2]
+            bottom_color = (100, 110, 125)  
+        
+        lib.dither_gradient_fill(
+            bg, (0, 0, width, 280),
+            top_color,
+            bottom_color,
+            peak_y, mountain_base_y,
+            lib.HILL_COLORS,
+            mask=silhouette
+        )
     
     print("Background statique généré !")
     return bg
 
 
-def create_middle_ground(scene: lib.Scene):
-
-    width = scene.window_size[0]
-    import random
-    import math
-    
-    print("Génération du plan moyen (perspective 3/4 + dégradé vert + patates de neige)...")
-    
-    mg_surface = pygame.Surface((width, 140))
+def snow_patch_layout(width):
+    """
+    Position et taille des taches de neige du plan moyen. Chaque pixel d'une
+    tache re-seede random : la tache suivante est tirée à partir de l'état
+    laissé par le dernier pixel parcouru, qu'on rejoue ici.
+    """
+    random.seed(789)
+    num_snow_patches = 12  
+    patches = []
     
-   
+    for patch_idx in range(num_snow_patches):
+        patch_y = random.randint(0, 140)
+        patch_x = random.randint(0, width)
+        
+        depth = patch_y / 140.0 
+        size_min = int(15 + depth * 20)  
+        size_max = int(30 + depth * 30)  
+        patch_base_size = random.randint(size_min, size_max)
+        
+        vertical_scale = 0.6 + depth * 0.4 
+        patches.append((patch_idx, patch_x, patch_y, patch_base_size, vertical_scale))
+        
+        # Dernier pixel (hors centre) dans le calque, en partant de la fin
+        scan_size = patch_base_size + 20
+        last = None
+        for dy in range(scan_size - 1, -scan_size - 1, -1):
+            py = patch_y + int(dy * vertical_scale)
+            if 0 <= py < 140:
+                for dx in range(scan_size - 1, -scan_size - 1, -1):
+                    if 0 <= patch_x + dx < width and (dx, dy) != (0, 0):
+                        last = (patch_x + dx, py)
+                        break
+            if last is not None:
+                break
+        if last is not None:
+            random.seed(last[0] * 73 + last[1] * 131)
+            random.uniform(-0.2, 0.2)
+    
+    return patches
+
+
+def render_middle_ground_band(y_start, y_end, band_seed, width, patches):
+    """
+    Lignes [y_start, y_end) du plan moyen : couleurs cibles de l'herbe, et
+    indice dans SNOW_COLORS des taches de neige (-1 = pas de neige).
+    Tous les pixels re-seedent random : le résultat ne dépend pas du découpage.
+    """
     grass_far = lib.GRASS_COLORS[0]      
     grass_near = lib.GRASS_COLORS[3]     
     
-    random.seed(42)
-    
-    for y in range(140):
+    rows = y_end - y_start
+    targets = np.zeros((rows, width, 3), dtype=np.int64)
+    for y in range(y_start, y_end):
         for x in range(width):
             depth = y / 140.0
             
@@ -225,35 +294,20 @@ def create_middle_ground(scene: lib.Scene):
             g = int(grass_far[1] + (grass_near[1] - grass_far[1]) * t)
             b = int(grass_far[2] + (grass_near[2] - grass_far[2]) * t)
             
-            target = (r, g, b)
-            
-            # Applique le dithering
-            pixel_color = lib.dither_pixel(x, y, target, lib.GRASS_COLORS)
-            mg_surface.set_at((x, y), pixel_color)
+            targets[y - y_start, x] = (r, g, b)
     
     # 2. TACHES DE NEIGE 
-    random.seed(789)
-    num_snow_patches = 12  
-    
-    for patch_idx in range(num_snow_patches):
-        patch_y = random.randint(0, 140)
-        patch_x = random.randint(0, width)
-        
-        depth = patch_y / 140.0 
-        size_min = int(15 + depth * 20)  
-        size_max = int(30 + depth * 30)  
-        patch_base_size = random.randint(size_min, size_max)
-        
-        vertical_scale = 0.6 + depth * 0.4 
-        
-
+    snow = np.full((rows, width), -1, dtype=np.int64)
+    for patch_idx, patch_x, patch_y, patch_base_size, vertical_scale in patches:
         scan_size = patch_base_size + 20
         for dy in range(-scan_size, scan_size):
+            py = patch_y + int(dy * vertical_scale)
+            if not y_start <= py < y_end:
+                continue
             for dx in range(-scan_size, scan_size):
                 px = patch_x + dx
-                py = patch_y + int(dy * vertical_scale)
                 
-                if 0 <= px < width and 0 <= py < 140:
+                if 0 <= px < width:
                     if dx == 0 and dy == 0:
                         dist = 0
                     else:
@@ -281,14 +335,35 @@ def create_middle_ground(scene: lib.Scene):
                         if dist_normalized + edge_noise < 1.0:
                             # Couleur de neige selon distance du centre
                             if dist_normalized < 0.3:
-                                target = lib.SNOW_COLORS[0]  # Blanc pur (centre)
+                                snow[py - y_start, px] = 0  # Blanc pur (centre)
                             elif dist_normalized < 0.7:
-                                target = lib.SNOW_COLORS[1]  # Blanc bleuté
+                                snow[py - y_start, px] = 1  # Blanc bleuté
                             else:
-                                target = lib.SNOW_COLORS[2]  # Gris clair (bords)
-                            
-                            pixel_color = lib.dither_pixel(px, py, target, lib.SNOW_COLORS)
-                            mg_surface.set_at((px, py), pixel_color)
+                                snow[py - y_start, px] = 2  # Gris clair (bords)
+    
+    return targets, snow
+
+
+def create_middle_ground(scene: lib.Scene):
+
+    width = scene.window_size[0]
+    
+    print("Génération du plan moyen (perspective 3/4 + dégradé vert + patates de neige)...")
+    
+    mg_surface = new_layer((width, 140))
+    
+    # Bandes horizontales calculées en parallèle puis recollées
+    patches = snow_patch_layout(width)
+    bands = lib.render_bands(render_middle_ground_band, 140, args=(width, patches))
+    targets = np.concatenate([band[0] for band in bands])
+    snow = np.concatenate([band[1] for band in bands])
+    
+    # Applique le dithering sur tout le calque d'un coup
+    lib.dither_array(targets, lib.GRASS_COLORS, mg_surface)
+    
+    snow_targets = np.array(lib.SNOW_COLORS)[np.maximum(snow, 0)]
+    snow_indices = lib.dither_indices(snow_targets, lib.SNOW_COLORS)
+    lib.blit_indices_at(mg_surface, snow_indices, lib.SNOW_COLORS, mask=snow >= 0)
     
     print("Plan moyen généré !")
     return mg_surface
@@ -430,9 +505,10 @@ def create_snow_ground(scene: lib.Scene):
     
     print("Génération du sol enneigé avec texture...")
     
-    snow_surface = pygame.Surface((width, 60))
+    snow_surface = new_layer((width, 60))
     random.seed(42)
     
+    targets = np.zeros((60, width, 3), dtype=np.int64)
     for y in range(60):
         for x in range(width):
             base_brightness = 1.0 - (y / 60) * 0.3
@@ -448,8 +524,8 @@ def create_snow_ground(scene: lib.Scene):
                 target = lib.SNOW_COLORS[1]
             else:
                 target = lib.SNOW_COLORS[2]
-            pixel_color = lib.dither_pixel(x, y, target, lib.SNOW_COLORS)
-            snow_surface.set_at((x, y), pixel_color)
+            targets[y, x] = target
+    lib.dither_array(targets, lib.SNOW_COLORS, snow_surface)
     
     random.seed(999)
     num_swords = 12
@@ -466,6 +542,10 @@ def create_snow_ground(scene: lib.Scene):
 
 
 def draw_tree_branch(surface, x, y, angle, length, thickness, depth, max_depth, side_bias=0, wind_offset=0):
+    """
+    Générateur : rend la main après chaque point de la branche, pour pouvoir
+    dessiner l'arbre par petits morceaux (voir tree_frame).
+    """
     if depth > max_depth or length < 2:
         return
     wind_strength = (depth / max_depth) * wind_offset
@@ -513,6 +593,7 @@ def draw_tree_branch(surface, x, y, angle, length, thickness, depth, max_depth,
                         adj_target = lib.TREE_COLORS[adj_color_index]
                         adj_pixel_color = lib.dither_pixel(px + dx, py + dy, adj_target, lib.TREE_COLORS)
                         surface.set_at((px + dx, py + dy), adj_pixel_color)
+        yield
     if depth < max_depth:
         base_spread = 25 if depth < 2 else 32
         angle_spread_left = base_spread
@@ -521,20 +602,21 @@ def draw_tree_branch(surface, x, y, angle, length, thickness, depth, max_depth,
         new_thickness = thickness * 0.7
         left_length = length * length_factor
         right_length = length * length_factor
-        draw_tree_branch(surface, end_x, end_y, angle + angle_spread_left, 
+        yield from draw_tree_branch(surface, end_x, end_y, angle + angle_spread_left, 
                         left_length, new_thickness, depth + 1, max_depth, side_bias, wind_offset)
-        draw_tree_branch(surface, end_x, end_y, angle - angle_spread_right, 
+        yield from draw_tree_branch(surface, end_x, end_y, angle - angle_spread_right, 
                         right_length, new_thickness, depth + 1, max_depth, side_bias, wind_offset)
         if depth >= 2:
-            draw_tree_branch(surface, end_x, end_y, angle, 
+            yield from draw_tree_branch(surface, end_x, end_y, angle, 
                             length * 0.65, new_thickness * 0.85, depth + 1, max_depth, side_bias, wind_offset)
 
 
-def create_tree(scene: lib.Scene, wind_offset=0):
-    tree_surface = pygame.Surface((300, 350), pygame.SRCALPHA)
+def tree_frame(wind_offset=0):
+    """Surface de l'arbre et itérateur des étapes qui la dessinent."""
+    tree_surface = new_layer(TREE_FRAME_SIZE, transparent=True)
     base_x = 80
     base_y = 350
-    draw_tree_branch(
+    steps = draw_tree_branch(
         tree_surface,
         x=base_x,
         y=base_y,
@@ -542,77 +624,97 @@ def create_tree(scene: lib.Scene, wind_offset=0):
         length=100,
         thickness=18,
         depth=0,
-        max_depth=7,
+        max_depth=TREE_MAX_DEPTH,
         side_bias=0.0,
         wind_offset=wind_offset
     )
     
-    return tree_surface
+    return tree_surface, steps
 
 
-def create_tree_animation(scene: lib.Scene):
-    cache_file = "tree_cache/tree_spritesheet.png"
-    num_frames = 60
-    frame_width = 300
-    frame_height = 350
+def create_tree(scene: lib.Scene, wind_offset=0):
+    tree_surface, steps = tree_frame(wind_offset)
+    for _ in steps:
+        pass
     
-    if os.path.exists(cache_file):
-        print(f"Chargement de la sprite sheet ({num_frames} frames)...")
+    return tree_surface
+
+
+def keep_random_state(steps):
+    """
+    Le dessin de l'arbre re-seede random à chaque pixel : entre deux étapes
+    faites pendant le jeu, on rend à random son état (flocons de neige...).
+    """
+    while True:
+        state = random.getstate()
         try:
-            spritesheet = pygame.image.load(cache_file).convert_alpha()
-            frames = []
-            
-            cols = 10
-            for i in range(num_frames):
-                col = i % cols
-                row = i // cols
-                x = col * frame_width
-                y = row * frame_height
-                frame = spritesheet.subsurface((x, y, frame_width, frame_height)).copy()
-                frames.append(frame)
-            
-            print("Sprite sheet chargée !")
-            return frames
-        except Exception as e:
-            print(f"Erreur lors du chargement : {e}")
-            print("Régénération de la sprite sheet...")
-    
-    print(f"Génération de l'animation de l'arbre ({num_frames} frames)...")
-    
-    cols = 10
-    rows = (num_frames + cols - 1) // cols  
-    sheet_width = cols * frame_width
-    sheet_height = rows * frame_height
-    
-    print(f"Création de la sprite sheet ({sheet_width}×{sheet_height} px)...")
-    spritesheet = pygame.Surface((sheet_width, sheet_height), pygame.SRCALPHA)
-    frames = []
-    
-    for i in range(num_frames):
-        if i % 10 == 0:
-            print(f"  Frame {i}/{num_frames}...")
-        
-        t = (i / num_frames) * 2 * math.pi
-        wind_offset = math.sin(t) * 2.5
-        tree_frame = create_tree(scene, wind_offset)
-        
+            next(steps)
+        except StopIteration:
+            return
+        finally:
+            random.setstate(state)
+        yield
+
+
+def tree_wind(i):
+    t = (i / TREE_FRAMES) * 2 * math.pi
+    return math.sin(t) * TREE_WIND
+
+
+def start_tree_frame(i):
+    surface, steps = tree_frame(tree_wind(i))
+    return surface, keep_random_state(steps)
+
+
+def tree_spritesheet(frames):
+    frame_width, frame_height = TREE_FRAME_SIZE
+    cols = TREE_SHEET_COLS
+    rows = (len(frames) + cols - 1) // cols  
+    spritesheet = new_layer((cols * frame_width, rows * frame_height), transparent=True)
+    for i, frame in enumerate(frames):
         col = i % cols
         row = i // cols
-        x = col * frame_width
-        y = row * frame_height
-        spritesheet.blit(tree_frame, (x, y))
-        
-        frames.append(tree_frame)
-    
-    try:
-        os.makedirs("tree_cache", exist_ok=True)
-        pygame.image.save(spritesheet, cache_file)
-        print(f"Sprite sheet sauvegardée !")
-    except Exception as e:
-        print(f"Erreur lors de la sauvegarde : {e}")
-    
-    print("Animation de l'arbre générée !")
-    return frames
+        spritesheet.blit(frame, (col * frame_width, row * frame_height))
+    return spritesheet
+
+
+def create_tree_animation(scene: lib.Scene):
+    """
+    Renvoie un lib.FrameProducer. Depuis le cache, toutes les images sont
+    prêtes ; sinon seule l'image 0 est dessinée tout de suite, les autres
+    pendant le temps libre de la boucle de jeu, puis la sprite sheet est
+    enregistrée dans le cache.
+    """
+    path = lib.bake_path(
+        "tree_spritesheet",
+        params=(LAYER_VERSION, INDEXED_LAYERS, TREE_FRAMES, TREE_FRAME_SIZE,
+                TREE_SHEET_COLS, TREE_MAX_DEPTH, TREE_WIND),
+        palettes=(lib.TREE_COLORS, lib.FULL_PALETTE),
+        size=scene.window_size,
+    )
+    spritesheet = lib.load_cached(path, "tree_spritesheet")
+    
+    if spritesheet is not None:
+        frame_width, frame_height = TREE_FRAME_SIZE
+        frames = []
+        for i in range(TREE_FRAMES):
+            col = i % TREE_SHEET_COLS
+            row = i // TREE_SHEET_COLS
+            x = col * frame_width
+            y = row * frame_height
+            frame = spritesheet.subsurface((x, y, frame_width, frame_height)).copy()
+            frames.append(frame)
+        return lib.FrameProducer(TREE_FRAMES, frames=frames)
+    
+    def save(frames):
+        lib.store_cached(tree_spritesheet(frames), path, "tree_spritesheet")
+        print("Animation de l'arbre générée !")
+    
+    print(f"Génération de l'animation de l'arbre ({TREE_FRAMES} frames, en arrière-plan)...")
+    animation = lib.FrameProducer(TREE_FRAMES, start_tree_frame, on_complete=save)
+    animation.render(0)
+    scene.idle_tasks.append(animation)
+    return animation
 
 
 def game_init(scene: lib.Scene) -> List:
@@ -623,9 +725,19 @@ def game_init(scene: lib.Scene) -> List:
     print(f"FPS cible : {scene.tick}")
     print("Appuyez sur ECHAP pour quitter")
     print("============================")
-    scene.static_background = create_static_background(scene)
-    scene.middle_ground = create_middle_ground(scene)
-    scene.snow_ground = create_snow_ground(scene)
+    # Chaque calque n'est généré qu'une fois, puis relu depuis le cache disque
+    scene.static_background = cached_layer(
+        scene, "static_background", create_static_background,
+        [lib.SKY_COLORS, lib.HILL_COLORS]
+    )
+    scene.middle_ground = cached_layer(
+        scene, "middle_ground", create_middle_ground,
+        [lib.GRASS_COLORS, lib.SNOW_COLORS]
+    )
+    scene.snow_ground = cached_layer(
+        scene, "snow_ground", create_snow_ground,
+        [lib.SNOW_COLORS, lib.GUTS_COLORS]
+    )
     scene.tree_animation = create_tree_animation(scene)
     scene.snowfall = snowflakes.SnowfallSystem(width, height, num_flakes=25)
     print("Système de flocons de neige initialisé (25 flocons)")
@@ -633,19 +745,22 @@ def game_init(scene: lib.Scene) -> List:
     return objects
 
 
-game = lib.Scene(
-    width=640, 
-    height=480, 
-    init=game_init,
-    prepaint=render_scene,
-    tick=60
-)
-RUN = True
-while RUN:
-    RUN = game.mainloop()
-
-print(f"\n=== FIN DU JEU ===")
-print(f"Fenêtre fermée après {lib.loops} frames")
-print(f"Durée totale : {game.time_game:.2f}s")
-print(f"FPS moyen : {lib.loops / game.time_game:.1f}")
+# Les processus de lib.render_bands réimportent ce module : le jeu ne doit
+# démarrer que dans le processus principal
+if __name__ == "__main__":
+    game = lib.Scene(
+        width=640, 
+        height=480, 
+        init=game_init,
+        prepaint=render_scene,
+        tick=60
+    )
+    RUN = True
+    while RUN:
+        RUN = game.mainloop()
+
+    print(f"\n=== FIN DU JEU ===")
+    print(f"Fenêtre fermée après {lib.loops} frames")
+    print(f"Durée totale : {game.time_game:.2f}s")
+    print(f"FPS moyen : {lib.loops / game.time_game:.1f}")
 
@@ -1,9 +1,18 @@
 from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Optional
+import hashlib
+import os
+import tempfile
+import time
+import numpy as np
 import pygame
 
 loops = 0
 
+# Temps minimal (s) donné aux tâches de fond à chaque image
+IDLE_MIN_BUDGET = 0.001
+
 
 class Scene:
     def __init__(
@@ -32,6 +41,12 @@ class Scene:
         self.snow_ground = None
         self.tree = None
         
+        # Tâches de fond (FrameProducer...) : step(deadline) appelé à chaque
+        # image dans la limite de idle_budget secondes, retirées une fois finies
+        self.idle_tasks: List = []
+        self.idle_budget: float = 0.006
+        self.frame_start = time.perf_counter()
+        
         if init is not None:
             self.objects = init(self)
         
@@ -61,12 +76,29 @@ class Scene:
         
         pygame.display.flip()
         
+        self.run_idle_tasks()
+        
         elapsed = self.clock.tick(self.tick)
+        self.frame_start = time.perf_counter()
         self.time_game += elapsed / 1000.0
         loops += 1
         
         return True
 
+    def run_idle_tasks(self) -> None:
+        if not self.idle_tasks:
+            return
+        # Pas plus que le temps qui reste avant l'image suivante, mais au
+        # moins IDLE_MIN_BUDGET pour avancer même si le jeu rame
+        remaining = self.frame_start + 1.0 / self.tick - time.perf_counter()
+        budget = max(IDLE_MIN_BUDGET, min(self.idle_budget, remaining))
+        deadline = time.perf_counter() + budget
+        for task in list(self.idle_tasks):
+            if task.step(deadline):
+                self.idle_tasks.remove(task)
+            if time.perf_counter() >= deadline:
+                break
+
 SKY_COLORS = [
     (200, 210, 220),
     (175, 185, 200),
@@ -156,13 +188,130 @@ BAYER_MATRIX_4x4 = [
     [15,  7, 13,  5]
 ]
 
+BAYER_THRESHOLDS = np.array(BAYER_MATRIX_4x4) / 16.0
+
+
+def bayer_threshold(x, y):
+    return BAYER_MATRIX_4x4[y % 4][x % 4] / 16.0
+
+
+def make_blue_noise(size=64, sigma=1.5, seed=0):
+    """
+    Texture de seuils « bruit bleu » size×size, raccordable sur les bords
+    (méthode void-and-cluster d'Ulichney). Les seuils vont de 0 à 1 comme
+    ceux de la matrice de Bayer, mais sans motif régulier visible.
+    """
+    rng = np.random.default_rng(seed)
+    n = size * size
+    # Noyau gaussien torique, appliqué par FFT
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma ** 2))
+    kernel_fft = np.fft.rfft2(kernel)
+
+    def energy(pattern):
+        return np.fft.irfft2(np.fft.rfft2(pattern) * kernel_fft, s=(size, size))
+
+    def tightest_cluster(pattern):
+        return np.argmax(np.where(pattern, energy(pattern), -np.inf))
+
+    def largest_void(pattern):
+        return np.argmin(np.where(pattern, np.inf, energy(pattern)))
+
+    # Motif initial : 10 % de points aléatoires, déplacés des amas vers les
+    # vides jusqu'à ce qu'ils soient répartis uniformément
+    pattern = rng.random((size, size)) < 0.1
+    while True:
+        cluster = tightest_cluster(pattern)
+        pattern.flat[cluster] = False
+        void = largest_void(pattern)
+        pattern.flat[void] = True
+        if void == cluster:
+            break
+
+    ranks = np.zeros(n, dtype=np.int64)
+    ones = int(pattern.sum())
+    current = pattern.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = tightest_cluster(current)
+        current.flat[cluster] = False
+        ranks[cluster] = rank
+    current = pattern.copy()
+    for rank in range(ones, n):
+        void = largest_void(current)
+        current.flat[void] = True
+        ranks[void] = rank
+    return ranks.reshape(size, size) / n
+
+
+BLUE_NOISE_SIZE = 64
+
+# Calculée à la première utilisation
+blue_noise_texture = [None]
+
+
+def get_blue_noise():
+    if blue_noise_texture[0] is None:
+        blue_noise_texture[0] = make_blue_noise(BLUE_NOISE_SIZE)
+    return blue_noise_texture[0]
+
+
+def blue_noise_threshold(x, y):
+    return float(get_blue_noise()[y % BLUE_NOISE_SIZE, x % BLUE_NOISE_SIZE])
+
+
+def threshold_map(method, origin, h, w):
+    """Seuils (h×w) de la méthode ordonnée method pour une zone placée en origin."""
+    if method == "bayer":
+        matrix = BAYER_THRESHOLDS
+    elif method == "blue_noise":
+        matrix = get_blue_noise()
+    else:
+        raise ValueError(f"Méthode de dithering inconnue : {method}")
+    n = len(matrix)
+    x0, y0 = origin
+    return matrix[np.ix_((y0 + np.arange(h)) % n, (x0 + np.arange(w)) % n)]
+
+
+# Diffusion d'erreur : (dx, dy, poids) vers les pixels pas encore traités
+DIFFUSION_KERNELS = {
+    "floyd_steinberg": [(1, 0, 7 / 16), (-1, 1, 3 / 16), (0, 1, 5 / 16), (1, 1, 1 / 16)],
+    "atkinson": [(1, 0, 1 / 8), (2, 0, 1 / 8), (-1, 1, 1 / 8), (0, 1, 1 / 8),
+                 (1, 1, 1 / 8), (0, 2, 1 / 8)],
+}
+
+# Précision de la table de couleur la plus proche pour la diffusion d'erreur
+DIFFUSION_BITS = 6
+
 def color_distance(c1, c2):
     r1, g1, b1 = c1
     r2, g2, b2 = c2
     return ((r2 - r1)**2 + (g2 - g1)**2 + (b2 - b1)**2) ** 0.5
 
 
-def find_closest_colors(target_color, palette):
+# sRGB (D65) -> XYZ, puis blanc de référence pour CIE Lab
+SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def srgb_to_lab(colors):
+    """Couleurs sRGB 0-255 (N×3) -> CIE Lab (N×3)."""
+    c = np.asarray(colors, dtype=np.float64).reshape(-1, 3) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ SRGB_TO_XYZ.T / D65_WHITE
+    delta = 6 / 29
+    f = np.where(xyz > delta ** 3, np.cbrt(xyz), xyz / (3 * delta ** 2) + 4 / 29)
+    return np.stack([
+        116 * f[:, 1] - 16,
+        500 * (f[:, 0] - f[:, 1]),
+        200 * (f[:, 1] - f[:, 2]),
+    ], axis=1)
+
+
+def compute_closest_colors(target_color, palette):
     distances = [(color_distance(target_color, c), c) for c in palette]
     
     distances.sort(key=lambda x: x[0])
@@ -181,12 +330,203 @@ def find_closest_colors(target_color, palette):
     return closest_color, second_closest_color, ratio
 
 
-def dither_pixel(x, y, target_color, palette):
-    color1, color2, ratio = find_closest_colors(target_color, palette)
+class PaletteIndex:
+    """
+    Arbre k-d sur les couleurs d'une palette : les deux plus proches voisins
+    en O(log P) au lieu de trier toute la palette. Mêmes résultats que
+    compute_closest_colors (à distance égale, la première couleur de la
+    palette gagne).
+    """
+
+    def __init__(self, points):
+        self.points = [tuple(p) for p in points]
+        self.root = self.build(list(range(len(self.points))))
+
+    def build(self, indices):
+        if not indices:
+            return None
+        # Coupe selon l'axe le plus étalé, au niveau de la médiane
+        spreads = [max(self.points[i][a] for i in indices) - min(self.points[i][a] for i in indices)
+                   for a in range(3)]
+        axis = spreads.index(max(spreads))
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        return (indices[mid], axis,
+                self.build(indices[:mid]), self.build(indices[mid + 1:]))
+
+    def nearest_two(self, color):
+        """Renvoie (indice1, distance1², indice2, distance2²)."""
+        inf = float("inf")
+        best = [(inf, -1), (inf, -1)]
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            i, axis, left, right = node
+            p = self.points[i]
+            d = (color[0] - p[0]) ** 2 + (color[1] - p[1]) ** 2 + (color[2] - p[2]) ** 2
+            if (d, i) < best[0]:
+                best[1] = best[0]
+                best[0] = (d, i)
+            elif (d, i) < best[1]:
+                best[1] = (d, i)
+            diff = color[axis] - p[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # <= : un point à égale distance peut encore gagner par son indice
+            if far is not None and diff * diff <= best[1][0]:
+                stack.append(far)
+            stack.append(near)
+        return best[0][1], best[0][0], best[1][1], best[1][0]
+
+    def closest_colors(self, color):
+        i1, d1, i2, d2 = self.nearest_two(color)
+        dist1 = d1 ** 0.5
+        dist2 = d2 ** 0.5
+        if dist1 + dist2 == 0:
+            ratio = 1.0
+        else:
+            ratio = dist2 / (dist1 + dist2)
+        return i1, i2, ratio
+
+
+# Au-delà de cette taille, les recherches couleur par couleur (ColorLUT.compute)
+# passent par un PaletteIndex. Les recherches par lot restent en numpy :
+# l'arbre en Python pur y serait plus lent que le parcours vectorisé.
+PALETTE_INDEX_MIN = 16
+
+PALETTE_INDEXES = {}
+
+
+def get_palette_index(palette):
+    key = tuple(tuple(c) for c in palette)
+    index = PALETTE_INDEXES.get(key)
+    if index is None:
+        index = PaletteIndex(key)
+        PALETTE_INDEXES[key] = index
+    return index
+
+
+class ColorLUT:
+    """
+    Table couleur -> (closest, second_closest, ratio) pour une palette.
+    bits = précision par composante : 8 = exacte (remplie au fur et à mesure),
+    moins = table quantifiée, pré-calculable d'un coup avec build().
+    perceptual : distances mesurées dans l'espace Lab plutôt qu'en RGB.
+    """
+
+    def __init__(self, palette, bits=8, perceptual=False):
+        self.palette = [tuple(c) for c in palette]
+        self.shift = 8 - bits
+        self.perceptual = perceptual
+        self.table = {}
+        self.index = None
+        if len(self.palette) >= PALETTE_INDEX_MIN and not perceptual:
+            self.index = get_palette_index(self.palette)
+        # Position de chaque couleur (la première en cas de doublon)
+        self.positions = {}
+        for i, c in enumerate(self.palette):
+            self.positions.setdefault(c, i)
+
+    def key(self, color):
+        s = self.shift
+        return (int(color[0]) >> s) << 16 | (int(color[1]) >> s) << 8 | (int(color[2]) >> s)
+
+    def compute(self, key):
+        s = self.shift
+        mask = (1 << (8 - s)) - 1
+        # Centre de la case quantifiée (la couleur elle-même si bits = 8)
+        half = (1 << s) // 2
+        r = ((key >> 16) << s) + half
+        g = (((key >> 8) & mask) << s) + half
+        b = ((key & mask) << s) + half
+        if self.perceptual:
+            first, second, ratio = closest_colors_array(np.array([(r, g, b)]), self.palette, True)
+            return self.palette[first[0]], self.palette[second[0]], float(ratio[0])
+        if self.index is not None:
+            i1, i2, ratio = self.index.closest_colors((r, g, b))
+            return self.palette[i1], self.palette[i2], ratio
+        return compute_closest_colors((r, g, b), self.palette)
+
+    def lookup(self, color):
+        key = self.key(color)
+        result = self.table.get(key)
+        if result is None:
+            result = self.compute(key)
+            self.table[key] = result
+        return result
+
+    def lookup_array(self, colors):
+        """lookup pour N couleurs (N×3) : renvoie (first, second, ratio) en indices."""
+        found = [self.lookup(c) for c in np.asarray(colors).tolist()]
+        first = np.array([self.positions[f[0]] for f in found], dtype=np.intp)
+        second = np.array([self.positions[f[1]] for f in found], dtype=np.intp)
+        ratio = np.array([f[2] for f in found], dtype=np.float64)
+        return first, second, ratio
+
+    def build(self, chunk=4096):
+        # Toutes les cases d'un coup, par paquets pour limiter la mémoire
+        s = self.shift
+        n = 1 << (8 - s)
+        half = (1 << s) // 2
+        cells = np.arange(n ** 3)
+        r, g, b = cells // (n * n), (cells // n) % n, cells % n
+        keys = (r << 16 | g << 8 | b).tolist()
+        centres = np.stack([(r << s) + half, (g << s) + half, (b << s) + half], axis=1)
+        for start in range(0, len(keys), chunk):
+            first, second, ratio = closest_colors_array(
+                centres[start:start + chunk], self.palette, self.perceptual)
+            for key, i1, i2, t in zip(keys[start:start + chunk], first.tolist(),
+                                      second.tolist(), ratio.tolist()):
+                self.table.setdefault(key, (self.palette[i1], self.palette[i2], t))
+        return self
+
+
+# Une table par contenu de palette (les tranches comme GUTS_COLORS[:4]
+# créent une nouvelle liste à chaque appel)
+COLOR_LUTS = {}
+
+# Précision des tables perceptuelles : 32 niveaux par composante,
+# calculées entièrement à la première utilisation
+PERCEPTUAL_BITS = 5
+
+
+def get_color_lut(palette, bits=8, perceptual=False):
+    key = (bits, perceptual, tuple(tuple(c) for c in palette))
+    lut = COLOR_LUTS.get(key)
+    if lut is None:
+        lut = ColorLUT(palette, bits, perceptual)
+        if perceptual:
+            lut.build()
+        COLOR_LUTS[key] = lut
+    return lut
+
+
+# Dernière palette utilisée : évite de recalculer la clé de contenu quand
+# on dessine tout un calque avec la même liste
+last_lut = [None, None, None]
+
+
+def find_closest_colors(target_color, palette, perceptual=False):
+    if last_lut[0] is not palette or last_lut[1] != perceptual:
+        last_lut[0] = palette
+        last_lut[1] = perceptual
+        if perceptual:
+            last_lut[2] = get_color_lut(palette, PERCEPTUAL_BITS, True)
+        else:
+            last_lut[2] = get_color_lut(palette)
+    return last_lut[2].lookup(target_color)
+
+
+def dither_pixel(x, y, target_color, palette, perceptual=False, method="bayer"):
+    color1, color2, ratio = find_closest_colors(target_color, palette, perceptual)
     
-    bayer_x = x % 4
-    bayer_y = y % 4
-    threshold = BAYER_MATRIX_4x4[bayer_y][bayer_x] / 16.0
+    if method == "bayer":
+        threshold = bayer_threshold(x, y)
+    elif method == "blue_noise":
+        threshold = blue_noise_threshold(x, y)
+    else:
+        raise ValueError(f"Méthode de dithering inconnue pour un pixel seul : {method}")
     
     if ratio > threshold:
         return color1
@@ -194,7 +534,187 @@ def dither_pixel(x, y, target_color, palette):
         return color2
 
 
-def dither_gradient(x, y, color_start, color_end, gradient_start, gradient_end, palette):
+def closest_colors_array(colors, palette, perceptual=False, chunk=4096):
+    """
+    Version tableau de compute_closest_colors : pour N couleurs (N×3),
+    renvoie les indices des deux plus proches dans la palette et le ratio.
+    Mêmes calculs (et même ordre en cas d'égalité) que la version scalaire.
+    perceptual : distances en Lab, sans table (utilisé pour les construire).
+    Traité par paquets de chunk couleurs : le tableau des écarts fait N×P×3.
+    """
+    if len(colors) > chunk:
+        parts = [closest_colors_array(colors[start:start + chunk], palette, perceptual, chunk)
+                 for start in range(0, len(colors), chunk)]
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+    if perceptual:
+        points = srgb_to_lab(colors)
+        pal = srgb_to_lab(palette)
+    else:
+        points = np.asarray(colors).astype(np.int64)
+        pal = np.array(palette, dtype=np.int64)
+    diff = points[:, None, :] - pal[None, :, :]
+    distances = (diff * diff).sum(axis=2) ** 0.5
+    order = np.argsort(distances, axis=1, kind="stable")
+    first = order[:, 0]
+    second = order[:, 1]
+    rows = np.arange(len(colors))
+    dist1 = distances[rows, first]
+    dist2 = distances[rows, second]
+    total = dist1 + dist2
+    ratio = np.divide(dist2, total, out=np.ones_like(total), where=total != 0)
+    return first, second, ratio
+
+
+def diffuse_indices(targets, palette, kernel, perceptual=False):
+    """
+    Diffusion d'erreur (Floyd–Steinberg, Atkinson...) ligne par ligne : seules
+    les lignes d'erreur que le noyau atteint encore sont gardées en mémoire
+    (deux pour Floyd–Steinberg, trois pour Atkinson). Renvoie les indices H×W.
+    """
+    h, w = targets.shape[:2]
+    lut = get_color_lut(palette, DIFFUSION_BITS, perceptual)
+    if len(lut.table) < 1 << (3 * DIFFUSION_BITS):
+        lut.build()
+    table = lut.table
+    positions = lut.positions
+    shift = lut.shift
+    depth = max(dy for _, dy, _ in kernel) + 1
+    # Marge de 2 pixels de chaque côté pour ne pas tester les bords
+    width = 3 * (w + 4)
+    errors = [[0.0] * width for _ in range(depth)]
+    indices = np.empty((h, w), dtype=np.intp)
+    for y, line in enumerate(targets.tolist()):
+        err = errors[0]
+        row = []
+        for x, (r, g, b) in enumerate(line):
+            o = 3 * (x + 2)
+            r += err[o]
+            g += err[o + 1]
+            b += err[o + 2]
+            key = ((min(255, max(0, int(r))) >> shift) << 16
+                   | (min(255, max(0, int(g))) >> shift) << 8
+                   | (min(255, max(0, int(b))) >> shift))
+            color = table[key][0]
+            row.append(positions[color])
+            er = r - color[0]
+            eg = g - color[1]
+            eb = b - color[2]
+            for dx, dy, weight in kernel:
+                target = errors[dy]
+                p = o + 3 * dx
+                target[p] += er * weight
+                target[p + 1] += eg * weight
+                target[p + 2] += eb * weight
+        indices[y] = row
+        errors.pop(0)
+        errors.append([0.0] * width)
+    return indices
+
+
+def dither_indices(targets, palette, origin=(0, 0), perceptual=False, method="bayer"):
+    """
+    Dithering d'une image entière : targets est un tableau H×W×3 des
+    couleurs voulues, origin la position de son coin (x, y) pour la phase de la
+    matrice. Renvoie les indices dans la palette (H×W).
+    perceptual : même table Lab que dither_pixel(..., perceptual=True).
+    method : "bayer", "blue_noise", "floyd_steinberg" ou "atkinson".
+    """
+    if method in DIFFUSION_KERNELS:
+        return diffuse_indices(targets, palette, DIFFUSION_KERNELS[method], perceptual)
+    h, w = targets.shape[:2]
+    # Les calques ont peu de couleurs différentes : calcul par couleur unique.
+    # Chaque couleur est réduite à un entier, bien plus rapide à trier que
+    # np.unique(axis=0) sur les triplets.
+    flat = targets.reshape(-1, 3).astype(np.int64)
+    low = flat.min() if flat.size else 0
+    base = (flat.max() - low + 1) if flat.size else 1
+    packed = ((flat[:, 0] - low) * base + (flat[:, 1] - low)) * base + (flat[:, 2] - low)
+    _, first_at, inverse = np.unique(packed, return_index=True, return_inverse=True)
+    if perceptual:
+        lut = get_color_lut(palette, PERCEPTUAL_BITS, True)
+        first, second, ratio = lut.lookup_array(flat[first_at])
+    else:
+        first, second, ratio = closest_colors_array(flat[first_at], palette)
+    inverse = inverse.reshape(h, w)
+    thresholds = threshold_map(method, origin, h, w)
+    return np.where(ratio[inverse] > thresholds, first[inverse], second[inverse])
+
+
+def dither_array(targets, palette, surface=None, origin=(0, 0), perceptual=False,
+                 method="bayer"):
+    """
+    Comme dither_pixel sur chaque pixel de targets (H×W×3), en une seule
+    opération. Renvoie le tableau H×W×3 des couleurs ; si surface est donnée,
+    l'écrit dedans à la position origin.
+    """
+    indices = dither_indices(targets, palette, origin, perceptual, method)
+    result = np.array(palette, dtype=np.uint8)[indices]
+    if surface is not None:
+        blit_indices_at(surface, indices, palette, origin)
+    return result
+
+
+def blit_array_at(surface, colors, origin=(0, 0), mask=None):
+    # surfarray est indexé [x, y], les tableaux d'image [y, x]
+    x0, y0 = origin
+    h, w = colors.shape[:2]
+    pixels = pygame.surfarray.pixels3d(surface)
+    zone = pixels.transpose(1, 0, 2)[y0:y0 + h, x0:x0 + w]
+    if mask is None:
+        zone[...] = colors
+    else:
+        zone[mask] = colors[mask]
+    del zone, pixels
+
+
+# Calques indexés : surfaces 8 bits dont chaque pixel est un indice dans
+# FULL_PALETTE. Un quart de la mémoire d'une surface 32 bits, et
+# set_palette() recolore tout le calque sans le redessiner.
+TRANSPARENT_INDEX = 255
+TRANSPARENT_COLOR = (255, 0, 255)
+
+
+def indexed_surface(size, palette=FULL_PALETTE, transparent=False):
+    """
+    Surface 8 bits utilisant palette. transparent : remplie avec
+    TRANSPARENT_INDEX, qui sert de colorkey (les calques avec alpha).
+    """
+    surface = pygame.Surface(size, 0, 8)
+    surface.set_palette(palette)
+    if transparent:
+        surface.set_palette_at(TRANSPARENT_INDEX, TRANSPARENT_COLOR)
+        surface.fill(TRANSPARENT_INDEX)
+        surface.set_colorkey(TRANSPARENT_INDEX)
+    return surface
+
+
+def surface_indices(palette, surface):
+    """Indice de chaque couleur de palette dans la palette de la surface 8 bits."""
+    return np.array([surface.map_rgb(c) for c in palette], dtype=np.uint8)
+
+
+def blit_indices_at(surface, indices, palette, origin=(0, 0), mask=None):
+    """
+    Écrit les indices (H×W, dans palette) dans la surface : directement en
+    indices si elle est en 8 bits, sinon en couleurs.
+    """
+    if surface.get_bitsize() != 8:
+        blit_array_at(surface, np.array(palette, dtype=np.uint8)[indices], origin, mask)
+        return
+    values = surface_indices(palette, surface)[indices]
+    x0, y0 = origin
+    h, w = values.shape
+    pixels = pygame.surfarray.pixels2d(surface)
+    zone = pixels.T[y0:y0 + h, x0:x0 + w]
+    if mask is None:
+        zone[...] = values
+    else:
+        zone[mask] = values[mask]
+    del zone, pixels
+
+
+def dither_gradient(x, y, color_start, color_end, gradient_start, gradient_end, palette,
+                    perceptual=False, method="bayer"):
     if gradient_end - gradient_start == 0:
         t = 0.0
     else:
@@ -207,4 +727,264 @@ def dither_gradient(x, y, color_start, color_end, gradient_start, gradient_end,
     
     target_color = (r, g, b)
     
-    return dither_pixel(x, y, target_color, palette)
\ No newline at end of file
+    return dither_pixel(x, y, target_color, palette, perceptual, method)
+
+
+def gradient_colors(ys, color_start, color_end, gradient_start, gradient_end):
+    """
+    Couleurs de dither_gradient pour les lignes ys, avec les mêmes calculs.
+    gradient_start / gradient_end : nombres, ou tableaux (une valeur par
+    colonne) et le résultat est alors H×W×3.
+    """
+    span = np.asarray(gradient_end) - np.asarray(gradient_start)
+    t = (ys - gradient_start) / np.where(span == 0, 1, span)
+    t = np.where(span == 0, 0.0, np.clip(t, 0.0, 1.0))
+    start = np.array(color_start, dtype=np.float64)
+    end = np.array(color_end, dtype=np.float64)
+    return (start + (end - start) * t[..., None]).astype(np.int64)
+
+
+def dither_gradient_fill(surface, rect, color_start, color_end,
+                         gradient_start, gradient_end, palette, mask=None,
+                         perceptual=False, method="bayer"):
+    """
+    Remplit rect = (x, y, w, h) de la surface comme dither_gradient sur
+    chaque pixel. Si le dégradé est le même pour toutes les colonnes, la
+    couleur n'est calculée qu'une fois par ligne. mask (h×w) limite
+    l'écriture, par exemple à la silhouette d'une montagne.
+    method : comme pour dither_indices.
+    """
+    x0, y0, w, h = rect
+    per_column = np.ndim(gradient_start) > 0 or np.ndim(gradient_end) > 0
+    if mask is not None:
+        # Inutile de traiter ce qui est hors de la silhouette
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if len(rows) == 0:
+            return None
+        top, bottom = rows[0], rows[-1] + 1
+        left, right = cols[0], cols[-1] + 1
+        mask = mask[top:bottom, left:right]
+        if np.ndim(gradient_start) > 0:
+            gradient_start = np.asarray(gradient_start)[left:right]
+        if np.ndim(gradient_end) > 0:
+            gradient_end = np.asarray(gradient_end)[left:right]
+        x0, y0, w, h = x0 + left, y0 + top, right - left, bottom - top
+    ys = np.arange(y0, y0 + h)
+    if per_column or method in DIFFUSION_KERNELS:
+        targets = gradient_colors(ys[:, None], color_start, color_end,
+                                  gradient_start, gradient_end)
+        targets = np.broadcast_to(targets, (h, w, 3))
+        indices = dither_indices(targets, palette, (x0, y0), perceptual, method)
+    else:
+        rows = gradient_colors(ys, color_start, color_end,
+                               gradient_start, gradient_end)
+        if perceptual:
+            lut = get_color_lut(palette, PERCEPTUAL_BITS, True)
+            first, second, ratio = lut.lookup_array(rows)
+        else:
+            first, second, ratio = closest_colors_array(rows, palette)
+        thresholds = threshold_map(method, (x0, y0), h, w)
+        indices = np.where(ratio[:, None] > thresholds,
+                           first[:, None], second[:, None])
+    colors = np.array(palette, dtype=np.uint8)[indices]
+    blit_indices_at(surface, indices, palette, (x0, y0), mask)
+    return colors
+
+
+def band_limits(height, bands):
+    """Découpe [0, height) en bandes horizontales (y_start, y_end) non vides."""
+    limits = [(height * i // bands, height * (i + 1) // bands) for i in range(bands)]
+    return [(start, end) for start, end in limits if start < end]
+
+
+def render_bands(render_band, height, args=(), seed=0, bands=None, workers=None):
+    """
+    Calcule un calque de hauteur height par bandes horizontales, chacune dans
+    un processus d'un ProcessPoolExecutor. render_band(y_start, y_end,
+    band_seed, *args) doit être une fonction de niveau module (elle est
+    envoyée aux processus) et renvoyer le tampon de pixels de sa bande.
+    band_seed ne dépend que de seed et du numéro de bande : le résultat ne
+    dépend pas de l'ordre d'exécution. Renvoie les résultats dans l'ordre
+    des bandes, que l'appelant recolle (np.concatenate).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if bands is None:
+        # Plus de bandes que de processus : les bandes chargées s'équilibrent
+        bands = 4 * workers
+    limits = band_limits(height, bands)
+    seeds = [seed * 1000003 + i for i in range(len(limits))]
+    if workers <= 1:
+        return [render_band(start, end, band_seed, *args)
+                for (start, end), band_seed in zip(limits, seeds)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_band, start, end, band_seed, *args)
+                   for (start, end), band_seed in zip(limits, seeds)]
+        return [future.result() for future in futures]
+
+
+# Cache disque des calques générés. Changer BAKE_CACHE_VERSION invalide tous
+# les fichiers (format, ou code des générateurs)
+BAKE_CACHE_DIR = "bake_cache"
+BAKE_CACHE_VERSION = 1
+
+
+def bake_key(name, params=(), palettes=(), size=None):
+    """Empreinte du contenu d'un calque : paramètres, palettes, résolution, version."""
+    palettes = tuple(tuple(tuple(c) for c in palette) for palette in palettes)
+    content = repr((BAKE_CACHE_VERSION, name, tuple(params), palettes, tuple(size or ())))
+    return hashlib.sha256(content.encode()).hexdigest()[:24]
+
+
+def save_layer(surface, path):
+    """Enregistre en PNG de façon atomique (fichier temporaire puis renommage)."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".png", dir=directory)
+    os.close(fd)
+    try:
+        pygame.image.save(surface, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def load_layer(path):
+    surface = pygame.image.load(path)
+    if surface.get_bitsize() == 8:
+        # Calque indexé : le PNG garde la palette mais pas la colorkey
+        if tuple(surface.get_palette_at(TRANSPARENT_INDEX))[:3] == TRANSPARENT_COLOR:
+            surface.set_colorkey(TRANSPARENT_INDEX)
+    elif pygame.display.get_surface() is not None:
+        if surface.get_flags() & pygame.SRCALPHA:
+            surface = surface.convert_alpha()
+        else:
+            surface = surface.convert()
+    return surface
+
+
+def bake_path(name, params=(), palettes=(), size=None, directory=BAKE_CACHE_DIR):
+    return os.path.join(directory, f"{name}-{bake_key(name, params, palettes, size)}.png")
+
+
+def load_cached(path, name):
+    """Calque en cache, ou None s'il n'existe pas ou est illisible."""
+    if not os.path.exists(path):
+        return None
+    try:
+        surface = load_layer(path)
+        print(f"{name} chargé depuis le cache")
+        return surface
+    except (pygame.error, OSError) as e:
+        print(f"Cache illisible ({e}), régénération de {name}...")
+        return None
+
+
+def store_cached(surface, path, name):
+    try:
+        save_layer(surface, path)
+    except (pygame.error, OSError) as e:
+        print(f"Erreur lors de la sauvegarde de {name} : {e}")
+
+
+def cached_layer(name, generate, params=(), palettes=(), size=None, directory=BAKE_CACHE_DIR):
+    """
+    Renvoie generate() en passant par le cache disque : le fichier est nommé
+    d'après bake_key(), donc un changement de paramètre, de palette ou de
+    résolution régénère le calque au lieu de réutiliser l'ancien.
+    """
+    path = bake_path(name, params, palettes, size, directory)
+    surface = load_cached(path, name)
+    if surface is None:
+        surface = generate()
+        store_cached(surface, path, name)
+    return surface
+
+
+def spread_order(count):
+    """0..count-1 dans un ordre qui couvre vite tout l'intervalle (0, n/2, n/4, 3n/4...)."""
+    order = []
+    seen = set()
+    step = count
+    while True:
+        for i in range(0, count, step):
+            if i not in seen:
+                seen.add(i)
+                order.append(i)
+        if step == 1:
+            return order
+        step = (step + 1) // 2
+
+
+class FrameProducer:
+    """
+    Images d'une animation calculées petit à petit pendant le temps libre
+    de Scene.mainloop. start_frame(i) renvoie (surface, étapes) : l'image
+    est prête quand l'itérateur étapes est épuisé, chaque étape devant
+    rester courte. Une image n'est visible (nearest) qu'une fois finie.
+    on_complete(frames) est appelé quand toutes sont prêtes.
+    """
+
+    def __init__(self, count, start_frame=None, on_complete=None, frames=None):
+        self.frames = list(frames) if frames is not None else [None] * count
+        self.start_frame = start_frame
+        self.on_complete = on_complete
+        self.pending = [i for i in spread_order(count) if self.frames[i] is None]
+        self.current = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def done(self):
+        return self.current is None and not self.pending
+
+    def render(self, index):
+        """Calcule l'image index tout de suite."""
+        if self.frames[index] is not None:
+            return
+        if self.current is not None and self.current[0] == index:
+            # Image commencée par step() : on termine ses étapes restantes
+            _, surface, steps = self.current
+            self.current = None
+        else:
+            surface, steps = self.start_frame(index)
+            if index in self.pending:
+                self.pending.remove(index)
+        for _ in steps:
+            pass
+        self.frames[index] = surface
+        self.check_complete()
+
+    def check_complete(self):
+        if self.done and self.on_complete is not None:
+            on_complete, self.on_complete = self.on_complete, None
+            on_complete(self.frames)
+
+    def step(self, deadline):
+        """Avance jusqu'à deadline (time.perf_counter()). Renvoie True une fois fini."""
+        while not self.done and time.perf_counter() < deadline:
+            if self.current is None:
+                index = self.pending.pop(0)
+                surface, steps = self.start_frame(index)
+                self.current = (index, surface, steps)
+            index, surface, steps = self.current
+            if next(steps, StopIteration) is StopIteration:
+                self.frames[index] = surface
+                self.current = None
+        self.check_complete()
+        return self.done
+
+    def nearest(self, index):
+        """Image index si elle est prête, sinon la plus proche (l'animation boucle)."""
+        frame = self.frames[index]
+        if frame is not None:
+            return frame
+        count = len(self.frames)
+        for offset in range(1, count // 2 + 1):
+            for candidate in ((index - offset) % count, (index + offset) % count):
+                if self.frames[candidate] is not None:
+                    return self.frames[candidate]
+        return None
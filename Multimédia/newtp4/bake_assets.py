@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import struct
+import pygame
+from libgame import AssetPack
+
+# Offline step: python bake_assets.py [assets_dir] [output]
+# Decodes every PNG and WAV of the assets directory once and writes them raw
+# in a single indexed file, loaded at runtime with Scene(pack=...).
+# The .xcf files are the GIMP sources of the PNGs and are not baked.
+
+ALIGN = 16
+# Byte order of the display surfaces (SDL ARGB8888): pack images blit onto
+# the screen without any per-pixel conversion
+PIXEL_FORMAT = "BGRA" if sys.byteorder == "little" else "ARGB"
+
+
+def bake(assets_dir: str, output: str) -> None:
+    pygame.mixer.init()
+    mixer = pygame.mixer.get_init()
+    blobs = []
+    images = {}
+    sounds = {}
+    for filename in sorted(os.listdir(assets_dir)):
+        name, ext = os.path.splitext(filename)
+        path = os.path.join(assets_dir, filename)
+        if ext == ".png":
+            img = pygame.image.load(path)
+            images[name] = list(img.get_size())
+            blobs.append(("images", name, pygame.image.tobytes(img, PIXEL_FORMAT)))
+        elif ext == ".wav":
+            sound = pygame.mixer.Sound(path)
+            raw = sound.get_raw()
+            sounds[name] = [len(raw)]
+            blobs.append(("sounds", name, raw))
+    index = {
+        "mixer": list(mixer),
+        "format": PIXEL_FORMAT,
+        "images": images,
+        "sounds": sounds,
+    }
+    # Offsets depend on the header size, which depends on the offsets:
+    # reserve enough digits with a first pass at a large offset
+    for kind, name, raw in blobs:
+        index[kind][name].insert(0, 10**12)
+    header_size = len(json.dumps(index).encode("utf-8"))
+    offset = len(AssetPack.MAGIC) + 4 + header_size
+    for kind, name, raw in blobs:
+        offset = (offset + ALIGN - 1) // ALIGN * ALIGN
+        index[kind][name][0] = offset
+        offset += len(raw)
+    header = json.dumps(index).encode("utf-8").ljust(header_size)
+    with open(output, "wb") as f:
+        f.write(AssetPack.MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for kind, name, raw in blobs:
+            f.write(bytes(-f.tell() % ALIGN))
+            f.write(raw)
+    print(f"Baked {len(images)} images and {len(sounds)} sounds into {output}")
+
+
+if __name__ == "__main__":
+    assets_dir = sys.argv[1] if len(sys.argv) > 1 else "assets"
+    output = sys.argv[2] if len(sys.argv) > 2 else "assets.pack"
+    bake(assets_dir, output)
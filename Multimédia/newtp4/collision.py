@@ -0,0 +1,222 @@
+from __future__ import annotations
+import atexit
+from array import array
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+# Pure collision math, without pygame, shared by Element and the worker
+# processes of the parallel narrow phase.
+
+# Per element in shared memory: x, y, half width, half height, vx, vy as
+# doubles, then the solids bit mask and the type index as unsigned 64 bits
+FIELDS = 6
+
+
+def collision_side(
+    x: float,
+    y: float,
+    sw: float,
+    sh: float,
+    vx: float,
+    vy: float,
+    ox: float,
+    oy: float,
+    ow: float,
+    oh: float,
+    ovx: float,
+    ovy: float,
+    etime: float,
+) -> List[Tuple[str, float, float]]:
+    """(side, time, where) collisions of box a (center x, y, half sizes
+    sw, sh, speed vx, vy) against box b, see Element.find_collision_side."""
+    infinity = float("inf")
+    t_left = infinity
+    t_right = infinity
+    t_top = infinity
+    t_bottom = infinity
+    mindeltaspeed = 0.01
+    maxtime = 2 * etime
+    deltavx = vx - ovx
+    deltavy = vy - ovy
+    # Check if there is collision
+    # This test supposes an important thing: at least one frame
+    # happens when the objects do intersect.
+    # If two objects have a relative speed too high, one can go
+    # through the other and there will be no collision
+    if not (
+        x - sw < ox + ow and x + sw > ox - ow and y - sh < oy + oh and y + sh > oy - oh
+    ):
+        return []
+    # Check collision from left and right if there is some real speed
+    if abs(deltavx) > mindeltaspeed:
+        if deltavx < 0:
+            left_a = x - sw - vx * etime
+            right_b = ox + ow - ovx * etime
+            t_left = (right_b - left_a) / deltavx
+            if abs(t_left) > maxtime:
+                t_left = infinity
+        else:
+            right_a = x + sw - vx * etime
+            left_b = ox - ow - ovx * etime
+            t_right = (left_b - right_a) / deltavx
+            if abs(t_right) > maxtime:
+                t_right = infinity
+
+    if abs(deltavy) * etime > mindeltaspeed:
+        if deltavy > 0:
+            bottom_a = y + sh - vy * etime
+            top_b = oy - oh - ovy * etime
+            t_bottom = (top_b - bottom_a) / (vy - ovy)
+            if abs(t_bottom) > maxtime:
+                t_bottom = infinity
+
+        else:
+            top_a = y - sh - vy * etime
+            bottom_b = oy + oh - ovy * etime
+            t_top = (bottom_b - top_a) / (vy - ovy)
+            if abs(t_top) > maxtime:
+                t_top = infinity
+    collisions: List[Tuple[str, float, float]] = []
+    t_min = min(t_top, t_bottom, t_left, t_right)
+    if t_min == infinity:
+        return collisions
+    if t_left == t_min:
+        l_left = left_a + t_left * vx
+        collisions.append(("left", t_left, l_left))
+    if t_right == t_min:
+        l_right = right_a + t_right * vx
+        collisions.append(("right", t_right, l_right))
+    if t_top == t_min:
+        l_top = top_a + t_top * vy
+        collisions.append(("top", t_top, l_top))
+    if t_bottom == t_min:
+        l_bottom = bottom_a + t_bottom * vy
+        collisions.append(("bottom", t_bottom, l_bottom))
+    return collisions
+
+
+# Worker side: the shared block stays attached between frames
+attached: Dict[str, SharedMemory] = {}
+
+
+def attach(name: str) -> SharedMemory:
+    shm = attached.get(name)
+    if shm is None:
+        # The parent grew its block, the old one is not used anymore
+        for old in attached.values():
+            old.close()
+        attached.clear()
+        try:
+            shm = SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching also registers the block, and
+            # the tracker would unlink it when the worker exits
+            shm = SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        attached[name] = shm
+    return shm
+
+
+def detect_strip(
+    name: str, capacity: int, count: int, lo: float, hi: float, etime: float
+) -> List[Tuple[str, float, float, int, int]]:
+    """Collisions of the pairs whose x overlap starts in [lo, hi).
+    Elements are given by their index in the shared arrays."""
+    shm = attach(name)
+    size = capacity * FIELDS * 8
+    state = shm.buf[:size].cast("d")
+    masks = shm.buf[size : size + capacity * 8].cast("Q")
+    types = shm.buf[size + capacity * 8 : size + capacity * 16].cast("Q")
+    results: List[Tuple[str, float, float, int, int]] = []
+    try:
+        # Sweep and prune on the elements that touch the strip
+        candidates = []
+        for i in range(count):
+            x, hw = state[i * FIELDS], state[i * FIELDS + 2]
+            if x - hw < hi and x + hw > lo:
+                candidates.append((x - hw, x + hw, i))
+        candidates.sort()
+        for a, (left_i, right_i, i) in enumerate(candidates):
+            box_i = state[i * FIELDS : (i + 1) * FIELDS].tolist()
+            for left_j, right_j, j in candidates[a + 1 :]:
+                if left_j >= right_i:
+                    break
+                # Each pair is owned by the strip where the overlap starts
+                if not lo <= left_j < hi:
+                    continue
+                box_j = state[j * FIELDS : (j + 1) * FIELDS].tolist()
+                if masks[i] >> types[j] & 1:
+                    for side, t, where in collision_side(*box_i, *box_j, etime):
+                        results.append((side, t, where, i, j))
+                if masks[j] >> types[i] & 1:
+                    for side, t, where in collision_side(*box_j, *box_i, etime):
+                        results.append((side, t, where, j, i))
+    finally:
+        state.release()
+        masks.release()
+        types.release()
+    return results
+
+
+class ParallelNarrowPhase:
+    """Runs the pair tests in worker processes. The world is cut in
+    vertical strips; element boxes, solids masks and type indices are
+    written once per call to a shared memory block read by the workers."""
+
+    def __init__(self, workers: int = 4, strips: Optional[int] = None) -> None:
+        self.pool = Pool(workers)
+        self.strips = strips if strips is not None else 2 * workers
+        self.capacity = 0
+        self.shm: Optional[SharedMemory] = None
+        atexit.register(self.close)
+
+    def reserve(self, count: int) -> SharedMemory:
+        if self.shm is None or count > self.capacity:
+            self.release_memory()
+            self.capacity = max(count, 2 * self.capacity, 256)
+            self.shm = SharedMemory(create=True, size=self.capacity * (FIELDS + 2) * 8)
+        return self.shm
+
+    def detect(
+        self,
+        boxes: List[Tuple[float, float, float, float, float, float]],
+        masks: List[int],
+        types: List[int],
+        etime: float,
+    ) -> List[Tuple[str, float, float, int, int]]:
+        """Same order as testing every subject against every other one."""
+        count = len(boxes)
+        if count < 2:
+            return []
+        shm = self.reserve(count)
+        size = self.capacity * FIELDS * 8
+        flat = array("d", [value for box in boxes for value in box])
+        shm.buf[: len(flat) * 8] = flat.tobytes()
+        shm.buf[size : size + count * 8] = array("Q", masks).tobytes()
+        shm.buf[size + self.capacity * 8 : size + self.capacity * 8 + count * 8] = (
+            array("Q", types).tobytes()
+        )
+        xmin = min(box[0] - box[2] for box in boxes)
+        xmax = max(box[0] + box[2] for box in boxes)
+        width = (xmax - xmin) / self.strips
+        bounds = [xmin + k * width for k in range(self.strips + 1)]
+        bounds[0] = float("-inf")
+        bounds[-1] = float("inf")
+        tasks = [
+            (shm.name, self.capacity, count, bounds[k], bounds[k + 1], etime)
+            for k in range(self.strips)
+        ]
+        merged = [c for part in self.pool.starmap(detect_strip, tasks) for c in part]
+        merged.sort(key=lambda c: (c[3], c[4]))
+        return merged
+
+    def release_memory(self) -> None:
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self) -> None:
+        self.pool.terminate()
+        self.release_memory()
@@ -29,7 +29,8 @@ def game_test(objects: List[libgame.Element], event: pygame.event.Event):
 
 
 if __name__ == "__main__":
-    game = libgame.Scene(init=game_init, controller=game_test)
+    assets = libgame.manifest(libgame.Ball, libgame.Rock, libgame.AutoWalker)
+    game = libgame.Scene(init=game_init, controller=game_test, preload=assets)
     # If needed, wait before starting
     # game.startupdelay(5)
     RUN = True
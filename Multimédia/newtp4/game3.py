@@ -1,19 +1,46 @@
 import libgame
 import pygame
+import os
+import random
 from typing import List, Tuple, Dict, Optional, Callable
 
+LEVEL = "level3"
+
+
+def build_level(width: int, height: int, screens: int = 50) -> None:
+    random.seed(3)
+    descriptions: List[list] = []
+    for i in range(screens):
+        ground_height = 20 if i % 2 == 0 else 50
+        descriptions.append(
+            [
+                "ground",
+                (255, 0, 0),
+                i * width,
+                height - ground_height,
+                width,
+                ground_height,
+            ]
+        )
+        for j in range(3):
+            x = i * width + random.randint(0, width)
+            descriptions.append(
+                ["tree", x, height - ground_height, random.randint(5, 9)]
+            )
+    libgame.ChunkStreamer.save(LEVEL, width, descriptions)
+
 
 def game_init(scene: libgame.Scene) -> List[libgame.Element]:
     width = scene.window_size[0]
     height = scene.window_size[1]
-    objects = [
-        libgame.AutoWalker(width // 8, height // 4, vx=0),
-        libgame.Ground((255, 0, 0), 0, height - 20, width, 20),
-        libgame.Ground((255, 0, 0), width, height - 50, width, 50),
-        libgame.Tree(100, height - 20, 8),
-        libgame.Tree(150, height - 20, 9),
-        libgame.Tree(125, height - 20, 5),
-    ]
+    if not os.path.exists(os.path.join(LEVEL, "world.json")):
+        build_level(width, height)
+    scene.camera_x = 0.0
+    scene.walker = libgame.AutoWalker(width // 8, height // 4, vx=0)
+    scene.streamer = libgame.ChunkStreamer(LEVEL, width, radius=1)
+    # The first chunks are needed right away, the walker stands on them
+    chunk_objects, _ = scene.streamer.update(scene.camera_x, wait=True)
+    objects = [scene.walker] + chunk_objects
     return objects
 
 
@@ -27,19 +54,28 @@ def game_test(objects: List[libgame.Element], event: pygame.event.Event):
 
 
 def game_prepaint(scene: libgame.Scene) -> bool:
-    walker = scene.objects[0]
+    walker = scene.walker
     dx = walker.rect.centerx - scene.window_size[0] // 2
     if abs(dx) > 0:
         for obj in scene.objects:
             obj.x -= dx * obj.depth / 10
             obj.adjust_position_from_center()
+        scene.camera_x += dx
+    added, removed = scene.streamer.update(scene.camera_x)
+    if removed:
+        scene.remove_objects(removed)
+    if added:
+        scene.add_objects(added)
     if walker.rect.top > scene.window_size[1] * 2:
         return False
     return True
 
 
 if __name__ == "__main__":
-    game = libgame.Scene(init=game_init, controller=game_test, prepaint=game_prepaint)
+    assets = libgame.manifest(libgame.AutoWalker, libgame.Tree)
+    game = libgame.Scene(
+        init=game_init, controller=game_test, prepaint=game_prepaint, preload=assets
+    )
     # If needed, wait before starting
     # game.startupdelay(5)
     RUN = True
@@ -6,11 +6,23 @@ from typing import List, Tuple, Dict, Optional, Callable
 def game_init(scene: libgame.Scene) -> List[libgame.Element]:
     width = scene.window_size[0]
     height = scene.window_size[1]
+    tile_size = 16
+    tileset = libgame.TileMap.make_tileset(
+        [(255, 0, 0), (255, 255, 0), libgame.Element.load_image("woodblock")],
+        tile_size,
+    )
+    columns, rows = width // tile_size, height // tile_size
+    level = libgame.TileMap(tileset, tile_size, columns, rows, solid=(1, 2, 3))
+    for col in range(columns):
+        level.set_tile(col, 0, 1)
+        level.set_tile(col, rows - 1, 1)
+    for row in range(1, rows - 1):
+        level.set_tile(0, row, 2)
+        level.set_tile(columns - 1, row, 2)
+    for col in range(5, 10):
+        level.set_tile(col, 5, 3)
     objects = [
-        libgame.Ground((255, 0, 0), 0, height - 20, width, 20),
-        libgame.Ground((255, 0, 0), 0, 0, width, 20),
-        libgame.Ground((255, 255, 0), 0, 21, 10, height - 42),
-        libgame.Ground((255, 255, 0), width - 10, 21, 10, height - 42),
+        level,
         libgame.Walker2D(width // 2, height // 2),
     ]
     return objects
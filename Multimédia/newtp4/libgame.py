@@ -1,16 +1,380 @@
 from __future__ import annotations
 import pygame
+import asyncio
 import math
-from typing import List, Tuple, Dict, Optional, Callable
-from time import sleep
+import os
+import json
+import mmap
+import queue
+import struct
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Any,
+    Coroutine,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Dict,
+    Optional,
+    Callable,
+)
+from time import perf_counter, sleep
+from collision import ParallelNarrowPhase, collision_side
 
 loops = 0
 
 
+class SpriteAtlas:
+    """Packs many small surfaces into a few large pages (shelf packing).
+    Packed images are subsurfaces of the pages, so they share their pixels."""
+
+    MAGIC = b"LGATLAS2"
+
+    def __init__(self, page_size: int = 1024, padding: int = 1) -> None:
+        self.page_size = page_size
+        self.padding = padding
+        self.pages: List[pygame.Surface] = []
+        # name -> (page index, rect inside the page)
+        self.rects: Dict[str, Tuple[int, pygame.Rect]] = {}
+        # asset file -> modification time when packed, to detect stale atlases
+        self.sources: Dict[str, float] = {}
+
+    def pack(self, images: Dict[str, pygame.Surface]) -> Dict[str, pygame.Surface]:
+        size = self.page_size
+        pad = self.padding
+        # The same surface can be registered under several names (walker1/walker15)
+        unique: Dict[int, pygame.Surface] = {}
+        for img in images.values():
+            unique[id(img)] = img
+        # Tallest first: shelves are then filled with similar heights
+        order = sorted(unique.values(), key=lambda i: (-i.get_height(), -i.get_width()))
+        placed: Dict[int, Tuple[int, pygame.Rect]] = {}
+        used: List[int] = []  # used height of each page
+        x, y, shelf_h = 0, 0, 0
+        for img in order:
+            w, h = img.get_size()
+            if w + pad > size or h + pad > size:
+                # Too big for a page, stays a standalone surface
+                continue
+            if not used:
+                used.append(0)
+            if x + w + pad > size:
+                x, y, shelf_h = 0, y + shelf_h, 0
+            if y + h + pad > size:
+                used.append(0)
+                x, y, shelf_h = 0, 0, 0
+            page = len(used) - 1
+            placed[id(img)] = (page, pygame.Rect(x, y, w, h))
+            x += w + pad
+            shelf_h = max(shelf_h, h + pad)
+            used[page] = max(used[page], y + shelf_h)
+        self.pages = [pygame.Surface((size, h), pygame.SRCALPHA) for h in used]
+        for img in order:
+            if id(img) in placed:
+                page, rect = placed[id(img)]
+                self.pages[page].blit(img, rect)
+        self.rects = {}
+        for name, img in images.items():
+            if id(img) in placed:
+                self.rects[name] = placed[id(img)]
+        return self.views()
+
+    def views(self) -> Dict[str, pygame.Surface]:
+        if pygame.display.get_surface() is not None:
+            self.pages = [page.convert_alpha() for page in self.pages]
+        return {
+            name: self.pages[page].subsurface(rect)
+            for name, (page, rect) in self.rects.items()
+        }
+
+    def save(self, path: str) -> None:
+        index = {
+            "pages": [list(page.get_size()) for page in self.pages],
+            "images": {
+                name: [page, rect.x, rect.y, rect.w, rect.h]
+                for name, (page, rect) in self.rects.items()
+            },
+            "sources": self.sources,
+        }
+        header = json.dumps(index).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(SpriteAtlas.MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for page in self.pages:
+                f.write(pygame.image.tobytes(page, "RGBA"))
+
+    @classmethod
+    def load(cls, path: str) -> SpriteAtlas:
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[: len(cls.MAGIC)] != cls.MAGIC:
+            raise ValueError(f"{path} is not a sprite atlas")
+        pos = len(cls.MAGIC)
+        (length,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        index = json.loads(data[pos : pos + length].decode("utf-8"))
+        pos += length
+        atlas = cls()
+        for w, h in index["pages"]:
+            nbytes = w * h * 4
+            page = pygame.image.frombytes(data[pos : pos + nbytes], (w, h), "RGBA")
+            atlas.pages.append(page)
+            pos += nbytes
+        for name, (page, x, y, w, h) in index["images"].items():
+            atlas.rects[name] = (page, pygame.Rect(x, y, w, h))
+        atlas.sources = index["sources"]
+        return atlas
+
+
+class AssetPack:
+    """Read side of the pack written by bake_assets.py: one file holding raw
+    images (in display pixel order) and raw PCM sounds, memory-mapped and
+    read without copies."""
+
+    MAGIC = b"LGPACK01"
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[: len(AssetPack.MAGIC)] != AssetPack.MAGIC:
+            raise ValueError(f"{path} is not an asset pack")
+        pos = len(AssetPack.MAGIC)
+        (length,) = struct.unpack_from("<I", self.data, pos)
+        pos += 4
+        index = json.loads(self.data[pos : pos + length].decode("utf-8"))
+        self.mixer: Tuple[int, int, int] = tuple(index["mixer"])
+        # Packs baked before the format was recorded are RGBA
+        self.format: str = index.get("format", "RGBA")
+        # name -> (offset, width, height)
+        self.image_index: Dict[str, List[int]] = index["images"]
+        # name -> (offset, length)
+        self.sound_index: Dict[str, List[int]] = index["sounds"]
+
+    def image(self, name: str) -> Optional[pygame.Surface]:
+        if name not in self.image_index:
+            return None
+        offset, w, h = self.image_index[name]
+        view = memoryview(self.data)[offset : offset + w * h * 4]
+        return pygame.image.frombuffer(view, (w, h), self.format)
+
+    def sound(self, name: str) -> Optional[pygame.mixer.Sound]:
+        # Raw PCM is only usable if the mixer runs with the baked format
+        if name not in self.sound_index or pygame.mixer.get_init() != self.mixer:
+            return None
+        offset, length = self.sound_index[name]
+        return pygame.mixer.Sound(
+            buffer=memoryview(self.data)[offset : offset + length]
+        )
+
+
+def surface_bytes(img: pygame.Surface) -> int:
+    w, h = img.get_size()
+    return w * h * img.get_bytesize()
+
+
+def mip_chain_bytes(chain: List[pygame.Surface]) -> int:
+    # The full size level is accounted for in Element.images
+    return sum(surface_bytes(img) for img in chain[1:])
+
+
+def sound_bytes(sound: pygame.mixer.Sound) -> int:
+    init = pygame.mixer.get_init()
+    if init is None:
+        return 0
+    frequency, format, channels = init
+    return int(sound.get_length() * frequency) * channels * abs(format) // 8
+
+
+class AssetCache:
+    """Name -> asset mapping with a byte budget and LRU eviction.
+    Pinned assets are never evicted. A budget of 0 means unlimited.
+    An evicted asset still used somewhere (by a live element) is found
+    again through a weak reference instead of being loaded twice."""
+
+    def __init__(self, size_of: Callable[[Any], int], budget: int = 0) -> None:
+        self.size_of = size_of
+        self.budget = budget
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.sizes: Dict[Hashable, int] = {}
+        self.pins: Dict[Hashable, int] = {}
+        self.evicted: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, name: Hashable) -> bool:
+        return name in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.entries)
+
+    def __getitem__(self, name: Hashable) -> Any:
+        value = self.entries[name]
+        self.entries.move_to_end(name)
+        return value
+
+    def get(self, name: Hashable) -> Any:
+        if name not in self.entries:
+            value = self.evicted.pop(name, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self[name] = value
+        self.hits += 1
+        return self[name]
+
+    def __setitem__(self, name: Hashable, value: Any) -> None:
+        if name in self.entries:
+            self.bytes -= self.sizes[name]
+        self.entries[name] = value
+        self.entries.move_to_end(name)
+        self.sizes[name] = self.size_of(value)
+        self.bytes += self.sizes[name]
+        self.evict(keep=name)
+
+    def __delitem__(self, name: Hashable) -> None:
+        del self.entries[name]
+        self.bytes -= self.sizes.pop(name)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def values(self):
+        return self.entries.values()
+
+    def items(self):
+        return self.entries.items()
+
+    def update(self, other: Dict[Hashable, Any]) -> None:
+        for name, value in other.items():
+            self[name] = value
+
+    def pin(self, name: Hashable) -> None:
+        self.pins[name] = self.pins.get(name, 0) + 1
+
+    def unpin(self, name: Hashable) -> None:
+        count = self.pins.get(name, 0) - 1
+        if count > 0:
+            self.pins[name] = count
+        else:
+            self.pins.pop(name, None)
+
+    def set_budget(self, budget: int) -> None:
+        self.budget = budget
+        self.evict()
+
+    def evict(self, keep: Optional[Hashable] = None) -> None:
+        if self.budget <= 0:
+            return
+        # Least recently used first
+        for name in list(self.entries):
+            if self.bytes <= self.budget:
+                break
+            if name == keep or name in self.pins:
+                continue
+            try:
+                self.evicted[name] = self.entries[name]
+            except TypeError:
+                pass  # not weakly referenceable (lists), can't be in use anyway
+            del self[name]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "budget": self.budget,
+            "pinned": len(self.pins),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SoundManager:
+    """Owns a fixed pool of mixer channels. Play requests are queued and
+    played once per frame by update(): a sound replayed before its cooldown
+    is dropped, and when every channel is busy the lowest priority voice
+    is stolen if the new sound has a higher priority."""
+
+    def __init__(self, voices: int = 8, cooldown: float = 0.08) -> None:
+        pygame.mixer.set_num_channels(voices)
+        self.channels = [pygame.mixer.Channel(i) for i in range(voices)]
+        self.playing: List[int] = [0] * voices  # priority of each channel
+        self.cooldown = cooldown
+        # Per-sound cooldowns, default is self.cooldown
+        self.cooldowns: Dict[str, float] = {}
+        self.last_played: Dict[str, float] = {}
+        # name -> highest priority requested during the frame
+        self.queue: Dict[str, int] = {}
+        self.played = 0
+        self.dropped = 0
+        self.stolen = 0
+
+    def request(self, name: str, priority: int = 0) -> None:
+        if name in self.queue:
+            self.dropped += 1
+            priority = max(priority, self.queue[name])
+        self.queue[name] = priority
+
+    def find_channel(self, priority: int) -> Optional[int]:
+        lowest = None
+        for i, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return i
+            if lowest is None or self.playing[i] < self.playing[lowest]:
+                lowest = i
+        if lowest is not None and self.playing[lowest] < priority:
+            self.stolen += 1
+            return lowest
+        return None
+
+    def update(self, now: float) -> None:
+        queue = sorted(self.queue.items(), key=lambda x: -x[1])
+        self.queue = {}
+        for name, priority in queue:
+            cooldown = self.cooldowns.get(name, self.cooldown)
+            if now - self.last_played.get(name, -cooldown) < cooldown:
+                self.dropped += 1
+                continue
+            i = self.find_channel(priority)
+            if i is None:
+                self.dropped += 1
+                continue
+            self.channels[i].play(Element.load_sound(name))
+            self.playing[i] = priority
+            self.last_played[name] = now
+            self.played += 1
+
+
 class Element:
     next_id = 1
-    images: Dict[str, pygame.Surface] = {}
-    sounds: Dict[str, pygame.mixer.Sound] = {}
+    # Assets used by the constructor, see manifest()
+    image_assets: Tuple[str, ...] = ()
+    sound_assets: Tuple[str, ...] = ()
+    images = AssetCache(surface_bytes)
+    sounds = AssetCache(sound_bytes)
+    atlas: Optional[SpriteAtlas] = None
+    pack: Optional[AssetPack] = None
+    sound_manager: Optional[SoundManager] = None
+    # name -> frames name0, name1... as a tuple, shared by all instances
+    animations: Dict[str, Tuple[pygame.Surface, ...]] = {}
+    # (name, scale) -> rescaled image, shared by all instances
+    scaled_images = AssetCache(surface_bytes)
+    # name -> [full size, 1/2, 1/4...], extended on demand
+    mipmaps = AssetCache(mip_chain_bytes)
+    # If > 0, requested scales are rounded to a multiple of this step
+    scale_step: float = 0.0
 
     @classmethod
     def get_id(cls):
@@ -20,20 +384,179 @@ class Element:
 
     @classmethod
     def load_image(cls, filename: str) -> pygame.Surface:
-        if filename not in cls.images:
-            cls.images[filename] = pygame.image.load("assets/" + filename + ".png")
-        return cls.images[filename].convert_alpha()
+        """Returns the shared, display-format surface for this image.
+        Don't draw into it: use Element.own_image for a private copy."""
+        img = cls.images.get(filename)
+        if img is None:
+            if cls.pack is not None:
+                # Pixels stay in the memory-mapped pack, no decoding
+                img = cls.pack.image(filename)
+            if img is None:
+                img = cls.prepare_image(cls.read_image(filename))
+            cls.images[filename] = img
+        return img
+
+    @classmethod
+    def read_image(cls, filename: str) -> pygame.Surface:
+        # Decoding only, no cache and no display access: safe in a worker thread
+        return pygame.image.load("assets/" + filename + ".png")
+
+    @classmethod
+    def prepare_image(cls, img: pygame.Surface) -> pygame.Surface:
+        if pygame.display.get_surface() is not None:
+            img = img.convert_alpha()
+        return img
 
     @classmethod
     def register_image(cls, filename: str, img: pygame.Surface) -> None:
         if filename not in cls.images:
+            # Generated images can't be reloaded from disk, never evict them
+            cls.images.pin(filename)
             cls.images[filename] = img
 
+    @classmethod
+    def get_mipmap(cls, filename: str, scale: float) -> Tuple[pygame.Surface, float]:
+        """Returns the smallest mip level still at least as large as scale,
+        and the scale of that level."""
+        chain = cls.mipmaps.get(filename)
+        if chain is None:
+            chain = [cls.load_image(filename)]
+            cls.mipmaps[filename] = chain
+        level = 0
+        while scale <= 0.5 ** (level + 1):
+            if level + 1 == len(chain):
+                w, h = chain[level].get_size()
+                if w < 2 or h < 2:
+                    break
+                chain.append(
+                    pygame.transform.smoothscale(chain[level], (w // 2, h // 2))
+                )
+                # Stored again so the cache counts the new level
+                cls.mipmaps[filename] = chain
+            level += 1
+        return chain[level], 0.5**level
+
+    @classmethod
+    def load_scaled_image(cls, filename: str, scale: float) -> pygame.Surface:
+        """Shared rescaled version of an image, computed once per (name, scale)."""
+        if cls.scale_step > 0:
+            scale = max(1, round(scale / cls.scale_step)) * cls.scale_step
+        key = (filename, scale)
+        img = cls.scaled_images.get(key)
+        if img is None:
+            if scale == 1:
+                img = cls.load_image(filename)
+            else:
+                mip, mip_scale = cls.get_mipmap(filename, scale)
+                img = pygame.transform.smoothscale_by(mip, scale / mip_scale)
+            cls.scaled_images[key] = img
+        return img
+
+    @classmethod
+    def get_animation(cls, name: str, count: int) -> Tuple[pygame.Surface, ...]:
+        frames = cls.animations.get(name)
+        if frames is None:
+            frames = tuple(cls.images[name + str(i)] for i in range(count))
+            # The tuple keeps the frames alive, evicting them would free nothing
+            for i in range(count):
+                cls.images.pin(name + str(i))
+            cls.animations[name] = frames
+        return frames
+
+    @classmethod
+    def build_atlas(
+        cls, page_size: int = 1024, objects: Iterable[Element] = ()
+    ) -> SpriteAtlas:
+        """Packs every loaded or registered image into atlas pages.
+        Element.images entries become subsurface views into the pages, and so
+        do the images of the given, already created, elements."""
+        atlas = SpriteAtlas(page_size)
+        old = dict(cls.images.items())
+        views = atlas.pack(old)
+        cls.images.update(views)
+        # The old surfaces are only freed once nothing else refers to them
+        replaced = {id(old[name]): view for name, view in views.items()}
+        for obj in objects:
+            obj.image = replaced.get(id(obj.image), obj.image)
+        for chain in cls.mipmaps.values():
+            chain[0] = replaced.get(id(chain[0]), chain[0])
+        for key, img in list(cls.scaled_images.items()):
+            if id(img) in replaced:
+                cls.scaled_images[key] = replaced[id(img)]
+        cls.animations.clear()
+        atlas.sources = cls.asset_times(old)
+        cls.atlas = atlas
+        return atlas
+
+    @classmethod
+    def asset_times(cls, names: Iterable[str]) -> Dict[str, float]:
+        """Modification time of the asset file behind each name that has one."""
+        times = {}
+        for name in names:
+            path = "assets/" + name + ".png"
+            if os.path.exists(path):
+                times[name] = os.path.getmtime(path)
+        return times
+
+    @classmethod
+    def load_atlas(cls, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        try:
+            atlas = SpriteAtlas.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load atlas {path}: {e}")
+            return False
+        if cls.asset_times(atlas.sources) != atlas.sources:
+            print(f"Atlas {path} is out of date, rebuilding it")
+            return False
+        cls.images.update(atlas.views())
+        cls.animations.clear()
+        cls.atlas = atlas
+        return True
+
     @classmethod
     def load_sound(cls, filename: str) -> pygame.mixer.Sound:
-        if filename not in cls.sounds:
-            cls.sounds[filename] = pygame.mixer.Sound("assets/" + filename + ".wav")
-        return cls.sounds[filename]
+        sound = cls.sounds.get(filename)
+        if sound is None:
+            if cls.pack is not None:
+                sound = cls.pack.sound(filename)
+            if sound is None:
+                sound = cls.read_sound(filename)
+            cls.sounds[filename] = sound
+        return sound
+
+    @classmethod
+    def read_sound(cls, filename: str) -> pygame.mixer.Sound:
+        return pygame.mixer.Sound("assets/" + filename + ".wav")
+
+    @classmethod
+    def load_pack(cls, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        try:
+            cls.pack = AssetPack(path)
+        except (OSError, ValueError) as e:
+            print(f"Could not load asset pack {path}: {e}")
+            return False
+        return True
+
+    @classmethod
+    def set_cache_budget(cls, images: int = 0, sounds: int = 0) -> None:
+        """Byte budgets for the image and sound caches, 0 for unlimited."""
+        cls.images.set_budget(images)
+        cls.scaled_images.set_budget(images)
+        cls.mipmaps.set_budget(images)
+        cls.sounds.set_budget(sounds)
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, Dict[str, int]]:
+        return {
+            "images": cls.images.stats(),
+            "scaled_images": cls.scaled_images.stats(),
+            "mipmaps": cls.mipmaps.stats(),
+            "sounds": cls.sounds.stats(),
+        }
 
     @classmethod
     def real_side(cls, side: str, opposite: bool) -> str:
@@ -75,90 +598,77 @@ class Element:
         self.mass = 10000
         self.elasticity = 0
         self.solids: List[str] = []
+        self.oldx = 0.0
+        self.oldy = 0.0
+        self.oldvx = 0.0
+        self.oldvy = 0.0
+        # self.image is shared with other elements until own_image is called
+        self.owns_image = False
 
     def find_collision_side(
         self, obj: Element, etime: float
     ) -> List[Tuple[str, float, float, "Element", "Element"]]:
-        infinity = float("inf")
-        # global loops
-        t_left = infinity
-        t_right = infinity
-        t_top = infinity
-        t_bottom = infinity
-        sw = self.rect.width / 2
-        sh = self.rect.height / 2
-        ow = obj.rect.width / 2
-        oh = obj.rect.height / 2
-        mindeltaspeed = 0.01
-        maxtime = 2 * etime
-        deltavx = self.vx - obj.vx
-        deltavy = self.vy - obj.vy
-        # Check if there is collision
-        # This test supposes an important thing: at least one frame
-        # happens when the objects do intersect.
-        # If two objects have a relative speed too high, one can go
-        # through the other and there will be no collision
-        if not (
-            self.x - sw < obj.x + ow
-            and self.x + sw > obj.x - ow
-            and self.y - sh < obj.y + oh
-            and self.y + sh > obj.y - oh
-        ):
-            return []
-        # Check collision from left and right if there is some real speed
-        if abs(deltavx) > mindeltaspeed:
-            if deltavx < 0:
-                left_a = self.x - sw - self.vx * etime
-                right_b = obj.x + ow - obj.vx * etime
-                t_left = (right_b - left_a) / deltavx
-                if abs(t_left) > maxtime:
-                    t_left = infinity
-            else:
-                right_a = self.x + sw - self.vx * etime
-                left_b = obj.x - ow - obj.vx * etime
-                t_right = (left_b - right_a) / deltavx
-                if abs(t_right) > maxtime:
-                    t_right = infinity
-
-        if abs(deltavy) * etime > mindeltaspeed:
-            if deltavy > 0:
-                bottom_a = self.y + sh - self.vy * etime
-                top_b = obj.y - oh - obj.vy * etime
-                t_bottom = (top_b - bottom_a) / (self.vy - obj.vy)
-                if abs(t_bottom) > maxtime:
-                    t_bottom = infinity
+        return self.find_box_collision_side(
+            obj.x,
+            obj.y,
+            obj.rect.width / 2,
+            obj.rect.height / 2,
+            obj.vx,
+            obj.vy,
+            obj,
+            etime,
+        )
 
-            else:
-                top_a = self.y - sh - self.vy * etime
-                bottom_b = obj.y + oh - obj.vy * etime
-                t_top = (bottom_b - top_a) / (self.vy - obj.vy)
-                if abs(t_top) > maxtime:
-                    t_top = infinity
-        collisions: List[Tuple[str, float, float, "Element", "Element"]] = []
-        t_min = min(t_top, t_bottom, t_left, t_right)
-        if t_min == infinity:
-            return collisions
-        if t_left == t_min:
-            l_left = left_a + t_left * self.vx
-            collisions.append(("left", t_left, l_left, self, obj))
-        if t_right == t_min:
-            l_right = right_a + t_right * self.vx
-            collisions.append(("right", t_right, l_right, self, obj))
-        if t_top == t_min:
-            l_top = top_a + t_top * self.vy
-            collisions.append(("top", t_top, l_top, self, obj))
-        if t_bottom == t_min:
-            l_bottom = bottom_a + t_bottom * self.vy
-            collisions.append(("bottom", t_bottom, l_bottom, self, obj))
-        return collisions
+    def find_box_collision_side(
+        self,
+        ox: float,
+        oy: float,
+        ow: float,
+        oh: float,
+        ovx: float,
+        ovy: float,
+        obj: Element,
+        etime: float,
+    ) -> List[Tuple[str, float, float, "Element", "Element"]]:
+        """Same as find_collision_side, against a box given by its center,
+        half sizes and speed. obj is the element reported in the collisions."""
+        return [
+            (side, t, where, self, obj)
+            for side, t, where in collision_side(
+                self.x,
+                self.y,
+                self.rect.width / 2,
+                self.rect.height / 2,
+                self.vx,
+                self.vy,
+                ox,
+                oy,
+                ow,
+                oh,
+                ovx,
+                ovy,
+                etime,
+            )
+        ]
 
     def __str__(self):
         return f"{self.type} {self.id} at {self.x},{self.y} v={self.vx},{self.vy}"
 
-    def play_sound(self, filename):
-        s = Element.load_sound(filename)
-        print('Playing "' + filename + '"')
-        s.play()
+    def own_image(self) -> pygame.Surface:
+        """Copy-on-write: replaces the shared image by a private copy,
+        which can then be modified without affecting other elements."""
+        assert self.image is not None
+        if not self.owns_image:
+            self.image = self.image.copy()
+            self.owns_image = True
+        return self.image
+
+    def play_sound(self, filename: str, priority: int = 0) -> None:
+        if Element.sound_manager is not None:
+            # Played at the end of the frame, outside of collision handling
+            Element.sound_manager.request(filename, priority)
+        else:
+            Element.load_sound(filename).play()
 
     def finalize(self):
         print(f"Created a {self.type} {self.id} at ({self.x,self.y})")
@@ -213,9 +723,21 @@ class Element:
         self, obj: Element, etime: float
     ) -> List[Tuple[str, float, float, "Element", "Element"]]:
         if obj.type in self.solids:
-            return self.find_collision_side(obj, etime)
+            return obj.collide_with(self, etime)
         return []
 
+    def collide_with(
+        self, obj: Element, etime: float
+    ) -> List[Tuple[str, float, float, "Element", "Element"]]:
+        """Collisions of obj against this element, as seen from obj."""
+        return obj.find_collision_side(self, etime)
+
+    def supports(self, obj: Element, top: float) -> bool:
+        """True if obj, its bottom at height top, still stands on this element."""
+        hw = self.rect.width / 2
+        ow = obj.rect.width / 2
+        return obj.x + ow > self.x - hw and obj.x - ow < self.x + hw
+
     def bump_from(
         self,
         side: str,
@@ -281,13 +803,187 @@ class Ground(Element):
         pygame.draw.rect(screen, self.color, self.rect)
 
 
+class TileMap(Element):
+    """Level stored as a 2D byte array of tile ids (row major), drawn from a
+    tileset sheet. Tile 0 is empty, tile n is the n-th tile of the sheet.
+    Collisions are found by looking up the cells under the other element,
+    so walls don't need one Element each."""
+
+    MAGIC = b"LGTILES1"
+
+    def __init__(
+        self,
+        tileset: pygame.Surface,
+        tile_size: int,
+        columns: int,
+        rows: int,
+        tiles: Optional[bytearray] = None,
+        solid: Tuple[int, ...] = (),
+        x: float = 0,
+        y: float = 0,
+    ):
+        super().__init__(pygame.Rect(x, y, columns * tile_size, rows * tile_size))
+        self.gravity = 0
+        self.tile_size = tile_size
+        self.columns = columns
+        self.rows = rows
+        if tiles is None:
+            tiles = bytearray(columns * rows)
+        assert len(tiles) == columns * rows
+        self.tiles = tiles
+        # solid_ids[tile id] is 1 for tiles that block
+        self.solid_ids = bytearray(256)
+        for tile in solid:
+            self.solid_ids[tile] = 1
+        self.tile_images: List[Optional[pygame.Surface]] = [None]
+        for i in range(tileset.get_width() // tile_size):
+            rect = (i * tile_size, 0, tile_size, tile_size)
+            self.tile_images.append(tileset.subsurface(rect))
+        self.x, self.y = self.rect.center
+        self.type = "ground"
+        self.finalize()
+
+    @classmethod
+    def make_tileset(
+        cls, tiles: List[Tuple[int, int, int] | pygame.Surface], tile_size: int
+    ) -> pygame.Surface:
+        """Builds a one row tileset sheet from colors and/or images."""
+        sheet = pygame.Surface((len(tiles) * tile_size, tile_size), pygame.SRCALPHA)
+        for i, tile in enumerate(tiles):
+            rect = pygame.Rect(i * tile_size, 0, tile_size, tile_size)
+            if isinstance(tile, pygame.Surface):
+                sheet.blit(pygame.transform.scale(tile, rect.size), rect)
+            else:
+                sheet.fill(tile, rect)
+        return sheet
+
+    @classmethod
+    def from_strings(
+        cls,
+        tileset: pygame.Surface,
+        tile_size: int,
+        lines: List[str],
+        legend: Dict[str, int],
+        solid: Tuple[int, ...] = (),
+        x: float = 0,
+        y: float = 0,
+    ) -> TileMap:
+        columns = max(len(line) for line in lines)
+        tiles = bytearray(columns * len(lines))
+        for row, line in enumerate(lines):
+            for col, char in enumerate(line):
+                tiles[row * columns + col] = legend.get(char, 0)
+        return cls(tileset, tile_size, columns, len(lines), tiles, solid, x, y)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        tileset: pygame.Surface,
+        tile_size: int,
+        solid: Tuple[int, ...] = (),
+        x: float = 0,
+        y: float = 0,
+    ) -> TileMap:
+        with open(path, "rb") as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a tile map")
+            columns, rows = struct.unpack("<II", f.read(8))
+            tiles = bytearray(f.read(columns * rows))
+        return cls(tileset, tile_size, columns, rows, tiles, solid, x, y)
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(TileMap.MAGIC)
+            f.write(struct.pack("<II", self.columns, self.rows))
+            f.write(self.tiles)
+
+    def get_tile(self, col: int, row: int) -> int:
+        if 0 <= col < self.columns and 0 <= row < self.rows:
+            return self.tiles[row * self.columns + col]
+        return 0
+
+    def set_tile(self, col: int, row: int, tile: int) -> None:
+        self.tiles[row * self.columns + col] = tile
+
+    def cell_at(self, x: float, y: float) -> Tuple[int, int]:
+        return (
+            int((x - self.rect.left) // self.tile_size),
+            int((y - self.rect.top) // self.tile_size),
+        )
+
+    def is_solid(self, x: float, y: float) -> bool:
+        col, row = self.cell_at(x, y)
+        return self.solid_ids[self.get_tile(col, row)] == 1
+
+    def collide_with(
+        self, obj: Element, etime: float
+    ) -> List[Tuple[str, float, float, "Element", "Element"]]:
+        collisions: List[Tuple[str, float, float, "Element", "Element"]] = []
+        ts = self.tile_size
+        half = ts / 2
+        # Same float box as collision_side: the integer rect can be a pixel
+        # behind and miss the cell the element is entering
+        hw = obj.rect.width / 2
+        hh = obj.rect.height / 2
+        col0, row0 = self.cell_at(obj.x - hw, obj.y - hh)
+        col1, row1 = self.cell_at(obj.x + hw, obj.y + hh)
+        for row in range(max(0, row0), min(self.rows, row1 + 1)):
+            base = row * self.columns
+            for col in range(max(0, col0), min(self.columns, col1 + 1)):
+                if self.solid_ids[self.tiles[base + col]]:
+                    collisions.extend(
+                        obj.find_box_collision_side(
+                            self.rect.left + col * ts + half,
+                            self.rect.top + row * ts + half,
+                            half,
+                            half,
+                            self.vx,
+                            self.vy,
+                            self,
+                            etime,
+                        )
+                    )
+        return collisions
+
+    def supports(self, obj: Element, top: float) -> bool:
+        # A solid tile in the row just below obj, not just anywhere on the map
+        hw = obj.rect.width / 2
+        col0, row = self.cell_at(obj.x - hw, top)
+        col1, _ = self.cell_at(obj.x + hw, top)
+        return any(
+            self.solid_ids[self.get_tile(col, row)] for col in range(col0, col1 + 1)
+        )
+
+    def do_paint(self, screen):
+        # Only the tiles inside the visible part of the map
+        visible = self.rect.clip(screen.get_clip())
+        if visible.width == 0 or visible.height == 0:
+            return
+        ts = self.tile_size
+        col0, row0 = self.cell_at(visible.left, visible.top)
+        col1, row1 = self.cell_at(visible.right - 1, visible.bottom - 1)
+        left, top = self.rect.topleft
+        images = self.tile_images
+        blits = []
+        for row in range(row0, row1 + 1):
+            base = row * self.columns
+            for col in range(col0, col1 + 1):
+                img = images[self.tiles[base + col]]
+                if img is not None:
+                    blits.append((img, (left + col * ts, top + row * ts)))
+        screen.blits(blits, False)
+
+
 class Tree(Element):
+    image_assets = ("tree",)
+
     def __init__(self, x: float, y: float, depth: int):
         if depth <= 0:
             depth = 1
         if depth > 20:
             depth = 20
-        img = pygame.transform.smoothscale_by(Element.load_image("tree"), depth / 10)
+        img = Element.load_scaled_image("tree", depth / 10)
         super().__init__(img.get_rect())
         self.image: pygame.Surface = img
         self.gravity = 0
@@ -303,6 +999,9 @@ class Tree(Element):
 
 
 class Rock(Element):
+    image_assets = ("small_rock",)
+    sound_assets = ("rock", "rock2")
+
     def __init__(self, x: float, y: float, vx: float = 0, vy: float = 0):
         img = Element.load_image("small_rock")
         super().__init__(img.get_rect())
@@ -358,7 +1057,7 @@ class Rock(Element):
         if other.type == "ground":
             if oldvy > 0.5 * self.gravity:
                 if oldvy > self.gravity:
-                    self.play_sound("rock")
+                    self.play_sound("rock", 1)
                 else:
                     self.play_sound("rock2")
         self.adjust_position_from_center()
@@ -366,6 +1065,8 @@ class Rock(Element):
 
 
 class Ball(Element):
+    image_assets = ("small_ball",)
+
     def __init__(self, x: float, y: float, vx: float = 0, vy: float = 0):
         img = Element.load_image("small_ball")
         super().__init__(img.get_rect())
@@ -387,8 +1088,9 @@ class Ball(Element):
 
 
 class BlueBall(Ball):
+    image_assets = ("small_ball", "small_ball2")
+
     def __init__(self, *args, **kargs):
-        img = Element.load_image("small_ball")
         super().__init__(*args, **kargs)
         self.image = Element.load_image("small_ball2")
         self.rect = self.image.get_rect()
@@ -397,14 +1099,19 @@ class BlueBall(Ball):
 
 
 class AutoWalker(Element):
-    def __init__(self, x: float, y: float, vx: float = 0, vy: float = 0):
+    image_assets = ("bonhomme_haut", "bonhomme_av", "bonhomme_ar")
+    sound_assets = ("blop",)
+
+    @classmethod
+    def build_frames(cls) -> None:
+        # Rotations are done once, the first walker registers the 32 frames
+        if "walker0" in Element.images and "walkerX15" in Element.images:
+            return
         base = Element.load_image("bonhomme_haut")
         av = Element.load_image("bonhomme_av")
         ar = Element.load_image("bonhomme_ar")
         rect = base.get_rect()
         w, h = rect.size
-        super().__init__(rect)
-        self.images: Dict[str, pygame.Surface] = {}
         for i in range(9):
             if i == 0:
                 pav, par = av, ar
@@ -422,14 +1129,15 @@ class AutoWalker(Element):
             opposite = pygame.transform.flip(merged_surface, True, False)
             Element.register_image("walker" + str(i), merged_surface)
             Element.register_image("walkerX" + str(i), opposite)
-            self.images["walker" + str(i)] = merged_surface
-            self.images["walkerX" + str(i)] = opposite
             if i > 0 and i < 8:
                 Element.register_image("walker" + str(16 - i), merged_surface)
                 Element.register_image("walkerX" + str(16 - i), opposite)
-                self.images["walker" + str(16 - i)] = merged_surface
-                self.images["walkerX" + str(16 - i)] = opposite
-        self.image = self.images["walker0"]
+
+    def __init__(self, x: float, y: float, vx: float = 0, vy: float = 0):
+        AutoWalker.build_frames()
+        frames = Element.get_animation("walker", 16)
+        super().__init__(frames[0].get_rect())
+        self.image = frames[0]
         Element.load_sound("blop")
         self.last_state: int = 0
         self.distance: float = 0
@@ -446,10 +1154,10 @@ class AutoWalker(Element):
     def do_paint(self, screen):
         state = int(self.distance / 8) % 16
         if self.vx > 0:
-            base = "walkerX"
+            frames = Element.get_animation("walkerX", 16)
         else:
-            base = "walker"
-        screen.blit(self.images[base + str(state)], self.rect)
+            frames = Element.get_animation("walker", 16)
+        screen.blit(frames[state], self.rect)
 
     def do_accelerate(self, etime):
         if self.vy == 0:
@@ -494,24 +1202,29 @@ class AutoWalker(Element):
 
 
 class Walker2D(Element):
-    def __init__(self, x: float, y: float):
+    image_assets = ("man",)
+    # Rows of the "man" sheet, in do_paint order
+    directions = ("manN", "manE", "manS", "manW")
+
+    @classmethod
+    def build_frames(cls) -> None:
+        if "manN0" in Element.images and "manW3" in Element.images:
+            return
         base = Element.load_image("man")
-        self.base = base
-        rect = pygame.Rect(0, 0, 16, 16)
-        w, h = rect.size
-        super().__init__(rect)
-        self.images: Dict[str, pygame.Surface] = {}
-        for i, xx in enumerate(["N", "E", "S", "W"]):
+        w, h = 16, 16
+        for i, name in enumerate(cls.directions):
             for pos in range(4):
-                img_name = f"man{xx}{pos}"
                 xpos = pos
                 if pos == 3:
                     xpos = 1
                 merged_surface = pygame.Surface.subsurface(base, xpos * w, i * h, w, h)
-                print(base, xpos * w, i * h, w, h)
-                self.images[img_name] = merged_surface
-                Element.register_image(img_name, merged_surface)
-        self.image = self.images["manN0"]
+                Element.register_image(name + str(pos), merged_surface)
+
+    def __init__(self, x: float, y: float):
+        Walker2D.build_frames()
+        rect = pygame.Rect(0, 0, 16, 16)
+        super().__init__(rect)
+        self.image = Element.get_animation("manN", 4)[0]
         self.last_state: int = 0
         self.distance: float = 0
         self.vx = 0
@@ -529,15 +1242,15 @@ class Walker2D(Element):
     def do_paint(self, screen):
         state = int(self.distance / 4) % 4
         if self.vy < 0:
-            base = "manN"
+            direction = 0
         elif self.vx < 0:
-            base = "manW"
+            direction = 3
         elif self.vx > 0:
-            base = "manE"
+            direction = 1
         else:
-            base = "manS"
-        name = base + str(state)
-        screen.blit(self.images[name], self.rect)
+            direction = 2
+        frames = Element.get_animation(Walker2D.directions[direction], 4)
+        screen.blit(frames[state], self.rect)
 
     def do_accelerate(self, etime):
         if abs(self.vy) > abs(self.vx):
@@ -581,7 +1294,280 @@ class Walker2D(Element):
         return True
 
 
+class ChunkStreamer:
+    """Streams a long level cut in vertical chunks of chunk_width pixels.
+    Each chunk is a JSON list of element descriptions [kind, *args] saved
+    in its own file; chunks within radius chunks of the view are read on a
+    background thread and their elements created, the others are dropped."""
+
+    kinds: Dict[str, Callable[..., Element]] = {
+        "ground": Ground,
+        "tree": Tree,
+        "rock": Rock,
+        "ball": Ball,
+    }
+
+    def __init__(self, directory: str, view_width: int, radius: int = 1) -> None:
+        with open(os.path.join(directory, "world.json")) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.chunk_width: int = meta["chunk_width"]
+        self.count: int = meta["count"]
+        self.view_width = view_width
+        self.radius = radius
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.loading: Dict[int, Future] = {}
+        self.loaded: Dict[int, List[Element]] = {}
+
+    @classmethod
+    def camera_x(cls, desc: list) -> float:
+        """Camera position at which the described element reaches the left
+        of the view. Elements drawn with parallax move by camera_x * depth / 10,
+        so a far tree is on screen long after its world x was passed."""
+        if desc[0] == "ground":
+            return desc[2]
+        if desc[0] == "tree":
+            # Same clamping as Tree.__init__
+            return desc[1] * 10 / min(20, max(1, desc[3]))
+        return desc[1]
+
+    @classmethod
+    def save(cls, directory: str, chunk_width: int, descriptions: List[list]) -> None:
+        """Cuts a level (descriptions with x as first argument after kind)
+        into chunk files, by the camera position where each element is on
+        screen. Files are written then renamed, never half written."""
+        chunks: Dict[int, List[list]] = {}
+        for desc in descriptions:
+            x = cls.camera_x(desc)
+            chunks.setdefault(int(x // chunk_width), []).append(desc)
+        os.makedirs(directory, exist_ok=True)
+        count = max(chunks) + 1 if chunks else 0
+        for index in range(count):
+            cls.write_json(cls.chunk_path(directory, index), chunks.get(index, []))
+        meta = {"chunk_width": chunk_width, "count": count}
+        cls.write_json(os.path.join(directory, "world.json"), meta)
+
+    @classmethod
+    def write_json(cls, path: str, data: object) -> None:
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def chunk_path(cls, directory: str, index: int) -> str:
+        return os.path.join(directory, f"chunk_{index:04d}.json")
+
+    def read_chunk(self, index: int) -> List[list]:
+        # Runs on the loader thread: file access and parsing only
+        with open(ChunkStreamer.chunk_path(self.directory, index)) as f:
+            return json.load(f)
+
+    def wanted(self, camera_x: float) -> range:
+        first = int(camera_x // self.chunk_width) - self.radius
+        last = int((camera_x + self.view_width) // self.chunk_width) + self.radius
+        return range(max(0, first), min(self.count, last + 1))
+
+    def build(self, descriptions: List[list], camera_x: float) -> List[Element]:
+        elements = []
+        for kind, *args in descriptions:
+            obj = ChunkStreamer.kinds[kind](*args)
+            # Saved positions are world positions, move them to the view
+            obj.x -= camera_x * obj.depth / 10
+            obj.adjust_position_from_center()
+            elements.append(obj)
+        return elements
+
+    def update(
+        self, camera_x: float, wait: bool = False
+    ) -> Tuple[List[Element], List[Element]]:
+        """Returns (elements to add, elements to remove) for this view."""
+        wanted = self.wanted(camera_x)
+        for index in wanted:
+            if index not in self.loaded and index not in self.loading:
+                self.loading[index] = self.executor.submit(self.read_chunk, index)
+        added: List[Element] = []
+        for index, future in list(self.loading.items()):
+            if wait or future.done():
+                del self.loading[index]
+                if index in wanted:
+                    self.loaded[index] = self.build(future.result(), camera_x)
+                    added.extend(self.loaded[index])
+        removed: List[Element] = []
+        for index in list(self.loaded):
+            if index not in wanted:
+                removed.extend(self.loaded.pop(index))
+        return added, removed
+
+
+def manifest(*classes: type) -> Dict[str, List[str]]:
+    """Images and sounds needed to create elements of these classes."""
+    images: List[str] = []
+    sounds: List[str] = []
+    for c in classes:
+        images.extend(name for name in c.image_assets if name not in images)
+        sounds.extend(name for name in c.sound_assets if name not in sounds)
+    return {"images": images, "sounds": sounds}
+
+
+class Preloader:
+    """Decodes the assets of a manifest on a thread pool.
+    Results are put in the Element caches from the main thread (finish),
+    since converting surfaces needs the display."""
+
+    def __init__(self, assets: Dict[str, List[str]], workers: int = 4) -> None:
+        self.images = [
+            name for name in assets.get("images", []) if name not in Element.images
+        ]
+        self.sounds = [
+            name for name in assets.get("sounds", []) if name not in Element.sounds
+        ]
+        self.workers = workers
+        self.pending: List[Tuple[str, str, Future]] = []
+
+    def start(self) -> None:
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        for name in self.images:
+            if Element.pack is not None and name in Element.pack.image_index:
+                continue
+            self.pending.append(
+                ("image", name, executor.submit(Element.read_image, name))
+            )
+        # Raw PCM from the pack is only usable with the format it was baked for
+        pack_sounds = (
+            Element.pack is not None and pygame.mixer.get_init() == Element.pack.mixer
+        )
+        for name in self.sounds:
+            if pack_sounds and name in Element.pack.sound_index:
+                continue
+            self.pending.append(
+                ("sound", name, executor.submit(Element.read_sound, name))
+            )
+        executor.shutdown(wait=False)
+
+    def progress(self) -> float:
+        if not self.pending:
+            return 1.0
+        return sum(1 for job in self.pending if job[2].done()) / len(self.pending)
+
+    def finish(self) -> None:
+        for kind, name, future in self.pending:
+            if kind == "image":
+                Element.images[name] = Element.prepare_image(future.result())
+            else:
+                Element.sounds[name] = future.result()
+        self.pending = []
+
+    def run(self, screen: pygame.Surface, clock: pygame.time.Clock) -> None:
+        """Starts loading and draws a progress bar until everything is ready."""
+        self.start()
+        w, h = screen.get_size()
+        bar = pygame.Rect(w // 4, h // 2 - 5, w // 2, 10)
+        while self.progress() < 1.0:
+            # Keeps the window responsive while the workers decode
+            pygame.event.pump()
+            screen.fill((0, 0, 0))
+            pygame.draw.rect(screen, (255, 255, 255), bar, 1)
+            done = bar.inflate(-4, -4)
+            done.width = int(done.width * self.progress())
+            pygame.draw.rect(screen, (255, 255, 255), done)
+            pygame.display.flip()
+            clock.tick(60)
+        self.finish()
+
+
+class FrameCapture:
+    """Records the displayed frames, as a PNG sequence (mode "png") or a
+    single raw video file (mode "raw", described by a .json file beside it).
+    Frames are copied into a pool of reusable buffers and written by a
+    background thread. When every buffer is waiting to be written, frames
+    are dropped instead of blocking the game."""
+
+    def __init__(
+        self,
+        screen: pygame.Surface,
+        path: str,
+        mode: str = "png",
+        buffers: int = 8,
+        fps: int = 60,
+    ) -> None:
+        assert mode in ("png", "raw")
+        self.path = path
+        self.mode = mode
+        # Same pixel format as the screen, only used by the writer thread
+        self.surface = pygame.Surface(screen.get_size(), 0, screen)
+        length = screen.get_buffer().length
+        self.free: queue.Queue[bytearray] = queue.Queue()
+        for i in range(buffers):
+            self.free.put(bytearray(length))
+        self.pending: queue.Queue[Optional[Tuple[int, bytearray]]] = queue.Queue()
+        self.frames = 0
+        self.written = 0
+        self.dropped = 0
+        if mode == "raw":
+            w, h = screen.get_size()
+            info = {
+                "width": w,
+                "height": h,
+                "pitch": screen.get_pitch(),
+                "bytesize": screen.get_bytesize(),
+                "masks": list(screen.get_masks()),
+                "fps": fps,
+            }
+            with open(path + ".json", "w") as f:
+                json.dump(info, f)
+            self.file = open(path, "wb")
+        else:
+            os.makedirs(path, exist_ok=True)
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+    def capture(self, screen: pygame.Surface) -> None:
+        index = self.frames
+        self.frames += 1
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return
+        pixels = screen.get_buffer()
+        buffer[:] = pixels
+        del pixels  # unlocks the screen
+        self.pending.put((index, buffer))
+
+    def writer(self) -> None:
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            index, buffer = item
+            if self.mode == "raw":
+                self.file.write(buffer)
+            else:
+                self.surface.get_buffer().write(bytes(buffer))
+                name = os.path.join(self.path, f"frame_{index:06d}.png")
+                pygame.image.save(self.surface, name)
+            self.written += 1
+            self.free.put(buffer)
+
+    def close(self) -> Dict[str, int]:
+        """Waits for the pending frames to be written."""
+        self.pending.put(None)
+        self.thread.join()
+        if self.mode == "raw":
+            self.file.close()
+        stats = {
+            "frames": self.frames,
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+        print(f"Captured {self.written} frames, dropped {self.dropped}")
+        return stats
+
+
 class Scene:
+    # id, x, y, vx, vy, ax, ay, oldx, oldy, oldvx, oldvy, distance, dontadjust
+    element_state = struct.Struct("<I11d?")
+
     def __init__(
         self,
         width: int = 640,
@@ -592,6 +1578,12 @@ class Scene:
         ] = None,
         prepaint: Optional[Callable[["Scene"], bool]] = None,
         tick=60,
+        atlas: Optional[str] = None,
+        pack: Optional[str] = None,
+        preload: Optional[Dict[str, List[str]]] = None,
+        voices: int = 8,
+        parallel: int = 0,
+        contacts: bool = True,
     ) -> None:
         pygame.init()
         pygame.mixer.init()
@@ -600,18 +1592,228 @@ class Scene:
         self.time_game: float = 0.0
         self.window_size = width, height
         self.screen = pygame.display.set_mode(self.window_size)
+        self.sound_manager = SoundManager(voices)
+        Element.sound_manager = self.sound_manager
+        # Worker processes for collision detection, used for big scenes only
+        self.narrow_phase: Optional[ParallelNarrowPhase] = None
+        if parallel > 0:
+            self.narrow_phase = ParallelNarrowPhase(parallel)
+        self.parallel_threshold = 200
+        self.type_ids: Dict[str, int] = {}
+        self.capture: Optional[FrameCapture] = None
+        # Resting contacts: (upper id, lower id) -> (upper, lower, height of
+        # the support surface relative to lower.y)
+        self.use_contacts = contacts
+        self.contacts: Dict[Tuple[int, int], Tuple[Element, Element, float]] = {}
         self.objects: List[Element] = []
+        if pack is not None:
+            Element.load_pack(pack)
+        # A saved atlas fills Element.images before any element is created
+        atlas_loaded = atlas is not None and Element.load_atlas(atlas)
+        if preload is not None:
+            Preloader(preload).run(self.screen, self.clock)
         if init is not None:
             self.objects = init(self)
+        if atlas is not None and not atlas_loaded:
+            Element.build_atlas(objects=self.objects).save(atlas)
         self.prepaint = prepaint
         self.objects_by_depth = sorted(self.objects, key=lambda x: x.depth)
         self.objects.sort(key=lambda x: x.id)
         self.controller = controller
 
+    def add_objects(self, objects: List[Element]) -> None:
+        self.objects.extend(objects)
+        self.objects.sort(key=lambda x: x.id)
+        self.objects_by_depth = sorted(self.objects, key=lambda x: x.depth)
+
+    def remove_objects(self, objects: List[Element]) -> None:
+        ids = set(obj.id for obj in objects)
+        for key in list(self.contacts):
+            if key[0] in ids or key[1] in ids:
+                del self.contacts[key]
+        self.objects[:] = [obj for obj in self.objects if obj.id not in ids]
+        self.objects_by_depth = [
+            obj for obj in self.objects_by_depth if obj.id not in ids
+        ]
+
+    def detect_collisions(
+        self, objects: List[Element], etime: float
+    ) -> List[Tuple[str, float, float, Element, Element]]:
+        collisions: List[Tuple[str, float, float, Element, Element]] = []
+        if self.narrow_phase is None or len(objects) < self.parallel_threshold:
+            for obj in objects:
+                collisions.extend(obj.do_detect(objects, etime))
+            return collisions
+        # Elements with their own collide_with (TileMap) stay on this process
+        plain: List[Element] = []
+        special: List[Element] = []
+        for obj in objects:
+            if obj.rect is None:
+                continue
+            if type(obj).collide_with is Element.collide_with:
+                plain.append(obj)
+            else:
+                special.append(obj)
+            for name in [obj.type] + obj.solids:
+                self.type_ids.setdefault(name, len(self.type_ids))
+        if len(self.type_ids) > 64:
+            # Solids masks are 64 bits
+            for obj in objects:
+                collisions.extend(obj.do_detect(objects, etime))
+            return collisions
+        boxes = [
+            (obj.x, obj.y, obj.rect.width / 2, obj.rect.height / 2, obj.vx, obj.vy)
+            for obj in plain
+        ]
+        masks = [
+            sum(1 << self.type_ids[name] for name in set(obj.solids)) for obj in plain
+        ]
+        types = [self.type_ids[obj.type] for obj in plain]
+        for side, t, where, i, j in self.narrow_phase.detect(
+            boxes, masks, types, etime
+        ):
+            collisions.append((side, t, where, plain[i], plain[j]))
+        for other in special:
+            for obj in plain + special:
+                if obj.id != other.id:
+                    collisions.extend(obj.detect(other, etime))
+            collisions.extend(other.do_detect(plain, etime))
+        return collisions
+
+    def start_capture(self, path: str, mode: str = "png", buffers: int = 8) -> None:
+        self.stop_capture()
+        self.capture = FrameCapture(self.screen, path, mode, buffers, self.tick)
+
+    def stop_capture(self) -> Optional[Dict[str, int]]:
+        if self.capture is None:
+            return None
+        stats = self.capture.close()
+        self.capture = None
+        return stats
+
+    def record_contact(
+        self,
+        side: str,
+        subject: Element,
+        other: Element,
+        res_subject: bool,
+        res_other: bool,
+        etime: float,
+    ) -> None:
+        """Keeps a collision as a resting contact when, after resolution,
+        the upper element is left with the speed of the one below it."""
+        if side == "bottom" and res_subject:
+            upper, lower = subject, other
+        elif side == "top" and res_other:
+            upper, lower = other, subject
+        else:
+            return
+        # Less than two frames of gravity: it will land again next frame
+        if upper.gravity > 0 and abs(upper.vy - lower.vy) <= 2 * upper.gravity * etime:
+            # The collision put upper on the surface it hit, which is not the
+            # top of lower's rect for elements with their own collide_with
+            offset = upper.y + upper.rect.height / 2 - lower.y
+            self.contacts[(upper.id, lower.id)] = (upper, lower, offset)
+
+    def apply_contacts(self) -> None:
+        """Puts resting elements back on their support before detection,
+        instead of letting them sink and be pushed back by a collision.
+        A contact is dropped when the elements separate."""
+        # Lowest supports first, so stacks are rebuilt from the bottom
+        contacts = sorted(self.contacts.items(), key=lambda c: -c[1][1].y)
+        for key, (upper, lower, offset) in contacts:
+            top = lower.y + offset
+            if (
+                upper.vy < lower.vy
+                or upper.y + upper.rect.height / 2 < top - 1
+                or not lower.supports(upper, top)
+            ):
+                del self.contacts[key]
+                continue
+            upper.y = top - upper.rect.height / 2
+            upper.vy = lower.vy
+            upper.dontadjust = True
+            upper.adjust_position_from_center()
+
+    def snapshot(self) -> bytes:
+        """Dynamic state of every element, packed in one buffer."""
+        state = Scene.element_state
+        buffer = bytearray(state.size * len(self.objects))
+        offset = 0
+        for obj in self.objects:
+            state.pack_into(
+                buffer,
+                offset,
+                obj.id,
+                obj.x,
+                obj.y,
+                obj.vx,
+                obj.vy,
+                obj.ax,
+                obj.ay,
+                obj.oldx,
+                obj.oldy,
+                obj.oldvx,
+                obj.oldvy,
+                obj.distance,
+                obj.dontadjust,
+            )
+            offset += state.size
+        return bytes(buffer)
+
+    def restore(self, snapshot: bytes) -> None:
+        """Puts back a snapshot. Elements are matched by id, those created
+        after the snapshot keep their state."""
+        by_id = {obj.id: obj for obj in self.objects}
+        for values in Scene.element_state.iter_unpack(snapshot):
+            obj = by_id.get(values[0])
+            if obj is None:
+                continue
+            (
+                obj.x,
+                obj.y,
+                obj.vx,
+                obj.vy,
+                obj.ax,
+                obj.ay,
+                obj.oldx,
+                obj.oldy,
+                obj.oldvx,
+                obj.oldvy,
+                obj.distance,
+                obj.dontadjust,
+            ) = values[1:]
+            obj.adjust_position_from_center()
+
     def startupdelay(self, t: float) -> None:
         pygame.display.flip()
         sleep(t)
 
+    async def run(self, *coroutines: Coroutine) -> None:
+        """Calls mainloop until it returns False, giving the hand to the asyncio
+        event loop between frames. Frames are paced with asyncio.sleep instead
+        of clock.tick, so the given coroutines (asset streaming, telemetry,
+        saves...) run during the wait. They are cancelled when the game ends."""
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        period = 1 / self.tick if self.tick > 0 else 0
+        tick = self.tick
+        self.tick = 0
+        next_frame = perf_counter()
+        try:
+            while self.mainloop():
+                next_frame += period
+                delay = next_frame - perf_counter()
+                if delay < 0:
+                    # Late frame: don't try to catch up with several quick ones
+                    next_frame = perf_counter()
+                    delay = 0
+                await asyncio.sleep(delay)
+        finally:
+            self.tick = tick
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     def mainloop(self) -> bool:
         global loops
         objects = self.objects
@@ -622,6 +1824,9 @@ class Scene:
         # Tick limit
         if self.tick > 0:
             self.clock.tick(self.tick)
+        if etime <= 0:
+            # Startup can be faster than the 1 ms timer resolution
+            return True
         for event in pygame.event.get():
             if self.controller is not None:
                 res = self.controller(objects, event)
@@ -634,11 +1839,11 @@ class Scene:
             obj.do_accelerate(etime)
         for obj in objects:
             obj.do_move(etime)
+        if self.use_contacts:
+            self.apply_contacts()
         search_collisions = True
         while search_collisions:
-            collisions = []
-            for obj in objects:
-                collisions.extend(obj.do_detect(objects, etime))
+            collisions = self.detect_collisions(objects, etime)
             collisions.sort(key=lambda x: x[2])
             if len(collisions) == 0:
                 search_collisions = False
@@ -703,6 +1908,8 @@ class Scene:
                 subject.do_move(overtime)
             if res_other:
                 other.do_move(overtime)
+            if self.use_contacts:
+                self.record_contact(side, subject, other, res_subject, res_other, etime)
             if debug:
                 print(
                     loops,
@@ -724,6 +1931,7 @@ class Scene:
                 )
         for obj in objects:
             obj.do_adjustspeed(etime)
+        self.sound_manager.update(self.time_game)
         if self.prepaint is not None:
             res = self.prepaint(self)
             if not res:
@@ -732,4 +1940,6 @@ class Scene:
         for obj in self.objects_by_depth:
             obj.do_paint(self.screen)
         pygame.display.flip()
+        if self.capture is not None:
+            self.capture.capture(self.screen)
         return True